@@ -0,0 +1,123 @@
+import os
+from typing import Dict
+
+from aiohttp import web
+
+from bot.hrbot import HrBot
+from config.logger import logger
+from config.registry import BotConfig
+from config.scheduler import Scheduler
+from config.types import Message
+from coordination import Coordinator
+from db import Database
+from handler.reconciliation import Reconciler
+
+
+class BotHost:
+    """
+    Обслуживает несколько ботов в одном процессе.
+
+    Все боты используют общие пул HTTP-соединений, базу данных, координатор и планировщик
+    фоновых задач. Обновления каждого бота приходят на свой вебхук /webhook/{bot_id}; лимиты
+    запросов и метрики у каждого бота свои.
+    """
+
+    def __init__(self, configs: Dict[str, BotConfig], db: Database, scheduler: Scheduler,
+                 coordinator: Coordinator = None) -> None:
+        """
+        Параметры:
+        - configs (dict): Настройки ботов по идентификатору.
+        - db (Database): Общая база данных.
+        - scheduler (Scheduler): Общий планировщик фоновых задач (с выбором лидера, если узлов несколько).
+        - coordinator (Coordinator, optional): Общее для узлов состояние; по умолчанию в локальной базе.
+        """
+        self.db = db
+        self.scheduler = scheduler
+        self.bots: Dict[str, HrBot] = {bot_id: HrBot(Message(), config=config, db=db, coordinator=coordinator,
+                                                     leader=scheduler.leader)
+                                       for bot_id, config in configs.items()}
+
+    def setup_routes(self, app: web.Application) -> None:
+        """
+        Регистрирует вебхуки ботов и административные эндпоинты.
+
+        Параметры:
+        - app (web.Application): Приложение aiohttp.
+        """
+        app.router.add_post('/webhook/{bot_id}', self.handle_webhook)
+        app.router.add_get('/admin/profile', HrBot.handle_profile)  # Профилирование по запросу (нужен ADMIN_TOKEN)
+        app.router.add_get('/admin/metrics', self.handle_metrics)  # Метрики ботов (нужен ADMIN_TOKEN)
+
+    async def handle_webhook(self, request):
+        """
+        Передает обновление боту, которому оно адресовано.
+
+        Параметры:
+        request: Объект запроса от сервера Telegram.
+
+        Возвращает:
+        web.Response: Ответ сервера (404, если бот не найден, 403, если секрет вебхука не совпадает).
+        """
+        bot = self.bots.get(request.match_info['bot_id'])
+        if bot is None:
+            logger.error(f"Webhook for unknown bot: {request.match_info['bot_id']}")
+            return web.Response(status=404)
+        if not bot.is_telegram_request(request):
+            logger.warning(f"Rejected webhook request for bot {bot.bot_id} with invalid secret token "
+                           f"from {request.remote}")
+            return web.Response(status=403)
+        return await bot.handle_webhook(request)
+
+    async def handle_metrics(self, request):
+        """
+        Административный эндпоинт: метрики каждого бота.
+
+        Возвращает:
+        web.Response: JSON с числом обновлений, решениями контроля доступа и числом
+        обрабатываемых обновлений по каждому боту.
+        """
+        if not HrBot.is_admin(request):
+            return web.Response(status=403)
+        metrics = {}
+        for bot_id, bot in self.bots.items():
+            admission = bot.command_handler.admission
+            metrics[bot_id] = {
+                'updates': bot.metrics['updates'],
+                'admission': dict(admission.stats),
+                'in_flight': admission.in_flight,
+                'recorder_dropped': bot.recorder.dropped if bot.recorder else 0,
+            }
+        return web.json_response(metrics)
+
+    async def set_webhooks(self, public_url: str) -> None:
+        """
+        Устанавливает вебхуки всех ботов.
+
+        Параметры:
+        - public_url (str): Публичный адрес веб-сервера.
+        """
+        for bot_id, bot in self.bots.items():
+            await bot.set_webhook(f"{public_url}/webhook/{bot_id}")
+
+    def schedule_jobs(self) -> None:
+        """
+        Регистрирует фоновые задачи ботов в общем планировщике. Задачи выполняются только на узле-лидере.
+        """
+        check_interval = float(os.getenv('PAYMENT_CHECK_INTERVAL', '5'))
+        for bot_id, bot in self.bots.items():
+            self.scheduler.every(f'payment_checks:{bot_id}', check_interval,
+                                 bot.command_handler.check_pending_payments, leader_only=True)
+
+        if os.getenv('RECONCILE_ENABLED', '0') == '1':
+            interval = float(os.getenv('RECONCILE_INTERVAL', '600'))
+            for bot_id, bot in self.bots.items():
+                reconciler = Reconciler(bot.coordinator, bot.command_handler.payment_processor, bot_id=bot_id)
+                self.scheduler.every(f'reconcile:{bot_id}', interval, reconciler.run, leader_only=True)
+
+    def close(self) -> None:
+        """
+        Дописывает записи обновлений всех ботов.
+        """
+        for bot in self.bots.values():
+            if bot.recorder:
+                bot.recorder.close()
@@ -1,12 +1,19 @@
+import collections
+import hmac
+import math
 import time
-import aiohttp
 import asyncio
-import requests
 from aiohttp import web
 from dotenv import load_dotenv
 from pyngrok import ngrok
+from config.http import get_session
+from config.registry import BotConfig
 from config.types import Message
 from config.logger import logger
+from config.tracing import tracer, profiler
+from bot.recorder import UpdateRecorder
+from coordination import ChatLockTimeout
+from handler.admission import SHED
 from handler.handlers import CommandHandler
 import os
 
@@ -15,18 +22,30 @@ load_dotenv()
 
 
 class HrBot:
-    def __init__(self, message: Message):
+    def __init__(self, message: Message, config: BotConfig = None, db=None, coordinator=None, leader=None):
 
         """
         Инициализирует объект бота.
 
         Параметры:
         message (Message): Объект сообщения, который содержит начальные данные для бота.
+        config (BotConfig, optional): Настройки бота, по умолчанию из переменных окружения.
+        db (Database, optional): Общая для нескольких ботов база данных.
+        coordinator (Coordinator, optional): Общее для узлов состояние (offset, блокировки чатов).
+        leader (LeaderElector, optional): Выбор лидера; опрос обновлений выполняет только лидер.
         """
-        self.base_url = os.getenv('BASE_URL')
+        self.config = config or BotConfig.from_env()
+        self.bot_id = self.config.bot_id
+        self.base_url = self.config.base_url
         self.offset = None
-        self.command_handler = CommandHandler(bot=self)  # Передаем ссылку на самого себя (бота) в CommandHandler
+        # Передаем ссылку на самого себя (бота) в CommandHandler
+        self.command_handler = CommandHandler(bot=self, db=db, coordinator=coordinator)
+        self.coordinator = self.command_handler.coordinator
+        self.leader = leader
         self.message = message
+        # Запись входящих обновлений (None, если выключена)
+        self.recorder = UpdateRecorder.from_env(self.bot_id)
+        self.metrics = collections.Counter()
 
     async def get_updates(self) -> list:
         """
@@ -38,23 +57,30 @@ class HrBot:
         params = {
             'timeout': 30
         }
+        if self.offset is None:
+            # Offset хранится в общем состоянии, чтобы опрос мог продолжить другой узел
+            offset = await self.coordinator.get(f"offset:{self.bot_id}")
+            self.offset = int(offset) if offset is not None else None
         if self.offset is not None:
             params['offset'] = self.offset
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(f"{self.base_url}/getUpdates", params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        updates = data.get('result', [])
-                        if updates:
-                            self.offset = updates[-1]['update_id'] + 1
-                            logger.info(updates)
-                        return updates
-                    else:
-                        logger.error(f"Failed to get updates: {response.status}")
-            except Exception as e:
-                logger.error(f"Error occurred while getting updates: {e}")
+        try:
+            async with get_session().get(self.config.api_url('getUpdates'), params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    updates = data.get('result', [])
+                    if updates:
+                        self.offset = updates[-1]['update_id'] + 1
+                        await self.coordinator.set(f"offset:{self.bot_id}", str(self.offset))
+                        if self.recorder:
+                            for update in updates:
+                                self.recorder.record(update)
+                        logger.info(updates)
+                    return updates
+                else:
+                    logger.error(f"Failed to get updates: {response.status}")
+        except Exception as e:
+            logger.error(f"Error occurred while getting updates: {e}")
         return []
 
     async def handle_updates(self, updates: list):
@@ -65,25 +91,60 @@ class HrBot:
         updates (list): Список обновлений от сервера Telegram.
         """
         for update in updates:
-            message_obj = update.get('message')
-            if message_obj:
-                chat_id = message_obj['chat']['id']
-                message_id = message_obj['message_id']
-                text = message_obj.get('text', 'No text')
-                user_id = message_obj['from']['id']
-                username = message_obj['from'].get('username', 'No username')
-
-                # Создаем объект Message
-                message = Message(bot=self, chat_id=chat_id, message_id=message_id,
-                                  content=text, username=username, timestamp=int(time.time()))
+            with tracer.trace(update):
+                try:
+                    await self.handle_update(update)
+                except ChatLockTimeout as e:
+                    # Offset уже сохранен и Telegram не доставит обновление повторно: сообщаем пользователю,
+                    # что запрос не обработан
+                    logger.error(f"Update {update.get('update_id')} was not handled: {e}")
+                    message = Message.from_update(update, bot=self)
+                    if message:
+                        await self.command_handler.send_admission_reply(message, SHED)
+
+    async def handle_update(self, update: dict):
+        """
+        Обрабатывает одно обновление от сервера Telegram.
+
+        Параметры:
+        update (dict): Обновление от сервера Telegram.
+
+        Исключения:
+        ChatLockTimeout: Если блокировку чата не удалось получить; обновление не обработано.
+        """
+        self.metrics['updates'] += 1
+        with tracer.span('update.dispatch'):
+            # Запрос подтверждения оплаты: отвечаем сразу, в обход контроля доступа (у Telegram лимит 10 секунд)
+            pre_checkout_query = update.get('pre_checkout_query')
+            if pre_checkout_query:
+                await self.command_handler.handle_pre_checkout_query(pre_checkout_query)
+                return
 
+            # Создаем объект Message
+            message = Message.from_update(update, bot=self)
+            successful_payment = update.get('message', {}).get('successful_payment')
+            if message and successful_payment:
+                # Успешная оплата счета Telegram
+                await self.command_handler.handle_successful_payment(message, successful_payment)
+            elif message:
                 # Логируем полученные данные
                 logger.info(
-                    f" Received message from user {username} {user_id} in chat {chat_id}."
-                    f" Message ID: {message_id}. Message text: {text}")
+                    f" Received message from user {message.username} {message.user_id} in chat {message.chat_id}."
+                    f" Message ID: {message.message_id}. Message text: {message.content}")
 
-                # Передаем объект сообщения в обработчике команд
-                await self.command_handler.handle_command(message)
+                # Контроль доступа до блокировки чата: отклоненные запросы не ждут блокировку
+                # и не обращаются к хранилищу
+                if not await self.command_handler.admit(message):
+                    return
+                # Передаем объект сообщения в обработчике команд; сообщения одного чата
+                # обрабатываются по одному на всех узлах
+                try:
+                    async with self.coordinator.chat_lock(f"{self.bot_id}:{message.chat_id}"):
+                        await self.command_handler.dispatch_command(message)
+                except ChatLockTimeout:
+                    # Сообщение не обработано: его повторная доставка не должна считаться дубликатом
+                    self.command_handler.admission.forget(message)
+                    raise
 
     async def start_polling(self):
         """
@@ -91,6 +152,11 @@ class HrBot:
         """
         logger.info("Bot started polling for updates...")
         while True:
+            # Опрос выполняет только узел-лидер, остальные ждут
+            if self.leader is not None and not self.leader.is_leader:
+                self.offset = None
+                await asyncio.sleep(1)
+                continue
             try:
                 updates = await self.get_updates()
                 if updates:
@@ -107,44 +173,113 @@ class HrBot:
         request: Объект запроса от сервера Telegram.
 
         Возвращает:
-        web.Response: Ответ сервера.
+        web.Response: Ответ сервера (503, если блокировку чата не удалось получить: Telegram
+        повторит доставку обновления).
         """
+        received = time.perf_counter()
         data = await request.json()  # Получаем данные из входящего запроса
+        if self.recorder:
+            self.recorder.record(data)
 
-        if 'message' in data:
-            logger.error(data)
-            # Обрабатываем обновление сообщения
-            await self.handle_updates([data])
+        if 'message' in data or 'pre_checkout_query' in data:
+            with tracer.trace(data, started=received):
+                tracer.mark('webhook.parse', received)
+                logger.error(data)
+                # Обрабатываем обновление сообщения
+                try:
+                    await self.handle_update(data)
+                except ChatLockTimeout as e:
+                    logger.error(f"Update {data.get('update_id')} was not handled, asking Telegram to retry: {e}")
+                    return web.Response(status=503)
             return web.Response()
         else:
             logger.error(f"Error response {data}")
             return web.Response()
 
+    def is_telegram_request(self, request) -> bool:
+        """
+        Проверяет, что запрос к вебхуку отправлен Telegram: заголовок X-Telegram-Bot-Api-Secret-Token
+        должен совпадать с секретом, переданным в setWebhook.
+        """
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        return hmac.compare_digest(token.encode('utf-8'), self.config.webhook_secret.encode('utf-8'))
+
     @staticmethod
-    async def start_webhook():
+    def is_admin(request) -> bool:
         """
-        Настраивает и запускает вебхук для получения обновлений от сервера Telegram.
+        Проверяет доступ к административным эндпоинтам: заголовок X-Admin-Token должен совпадать
+        с переменной окружения ADMIN_TOKEN.
+        """
+        admin_token = os.getenv('ADMIN_TOKEN')
+        token = request.headers.get('X-Admin-Token', '')
+        return bool(admin_token) and hmac.compare_digest(token.encode('utf-8'), admin_token.encode('utf-8'))
+
+    @staticmethod
+    async def handle_profile(request):
+        """
+        Административный эндпоинт: включает сэмплирующий профилировщик на N секунд и возвращает профиль.
+
+        Доступ по заголовку X-Admin-Token, совпадающему с переменной окружения ADMIN_TOKEN.
+
+        Параметры:
+        request: Объект запроса, параметр seconds задает длительность (по умолчанию 10, больше 0 и не более 60).
+
+        Возвращает:
+        web.Response: Стеки в свернутом формате (flamegraph collapsed stacks).
+        """
+        if not HrBot.is_admin(request):
+            return web.Response(status=403)
+        try:
+            seconds = float(request.query.get('seconds', '10'))
+        except ValueError:
+            return web.Response(status=400, text="Invalid seconds")
+        # nan не ограничивается min() и asyncio.sleep(nan) не завершается
+        if not math.isfinite(seconds) or seconds <= 0:
+            return web.Response(status=400, text="Invalid seconds")
+        seconds = min(seconds, 60.0)
+        try:
+            profile = await profiler.profile(seconds)
+        except RuntimeError as e:
+            return web.Response(status=409, text=str(e))
+        logger.info(f"Profile collected for {seconds} s")
+        return web.Response(text=profile)
+
+    @staticmethod
+    def start_tunnel(port: str = '3000') -> str:
+        """
+        Запускает ngrok и возвращает публичный адрес для вебхуков.
+
+        Параметры:
+        port (str): Локальный порт веб-сервера.
+
+        Возвращает:
+        str: Публичный адрес ngrok.
         """
         # Закрываем все активные сеансы ngrok
         ngrok.kill()
 
         # Запуск ngrok
-        ngrok_process = ngrok.connect('3000')
-        # logger.info(ngrok_process)
+        ngrok_process = ngrok.connect(port)
 
         # Ждем, пока ngrok будет готов
-        ngrok_url = ngrok_process.public_url
+        return ngrok_process.public_url
 
-        # Устанавливаем вебхук через API Telegram
-        webhook_url = f"{ngrok_url}/webhook"
-        api_url = f"{os.getenv('SET_WEBHOOK_URL')}?url={webhook_url}"
+    async def set_webhook(self, webhook_url: str):
+        """
+        Устанавливает вебхук бота через API Telegram. Telegram будет передавать секрет бота в заголовке
+        X-Telegram-Bot-Api-Secret-Token каждого запроса.
 
+        Параметры:
+        webhook_url (str): Публичный адрес вебхука, например {ngrok_url}/webhook/{bot_id}.
+        """
+        params = {'url': webhook_url, 'secret_token': self.config.webhook_secret}
         try:
-            response = requests.get(api_url)
-            response_data = response.json()
-            if response_data.get('ok'):
-                logger.info(f"Webhook successfully set up. URL: {webhook_url}")
-            else:
-                logger.error(f"Failed to set up webhook. Telegram API response: {response_data}")
+            async with get_session().get(self.config.api_url('setWebhook'), params=params) as response:
+                response_data = await response.json()
+                if response_data.get('ok'):
+                    logger.info(f"Webhook successfully set up for bot {self.bot_id}. URL: {webhook_url}")
+                else:
+                    logger.error(f"Failed to set up webhook for bot {self.bot_id}. "
+                                 f"Telegram API response: {response_data}")
         except Exception as e:
             logger.error(f"Error occurred while setting up webhook: {e}")
@@ -0,0 +1,174 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from config.logger import logger
+
+
+class UpdateRecorder:
+    """
+    Записывает входящие обновления Telegram в сжатые сегменты JSONL.
+
+    Обработчик обновлений только кладет обновление в очередь, сериализация, сжатие и запись
+    на диск выполняются фоновым потоком. Сегмент закрывается и начинается новый, когда объем
+    записанных в него данных превышает segment_bytes. Если очередь переполнена, обновление
+    не записывается (запись не должна замедлять обработку).
+
+    Каждая строка сегмента: {"ts": время получения, "update": обновление}.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, max_queue: int = 10000) -> None:
+        """
+        Параметры:
+        - directory (str): Папка для сегментов.
+        - segment_bytes (int): Размер сегмента (до сжатия), после которого начинается новый.
+        - max_queue (int): Максимальная длина очереди на запись.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.dropped = 0
+        self._segment_seq = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, bot_id: str = 'default') -> Optional['UpdateRecorder']:
+        """
+        Создает и запускает рекордер, если задана переменная окружения RECORD_UPDATES=1.
+
+        Сегменты каждого бота пишутся в свою папку RECORD_DIR/{bot_id} (по умолчанию recordings),
+        размер сегмента задается RECORD_SEGMENT_MB.
+
+        Параметры:
+        - bot_id (str): Идентификатор бота.
+
+        Возвращает:
+        - UpdateRecorder или None, если запись выключена.
+        """
+        if os.getenv('RECORD_UPDATES', '0') != '1':
+            return None
+        recorder = cls(os.path.join(os.getenv('RECORD_DIR', 'recordings'), bot_id),
+                       segment_bytes=int(float(os.getenv('RECORD_SEGMENT_MB', '64')) * 1024 * 1024))
+        recorder.start()
+        return recorder
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._write_loop, name='update-recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"Recording updates to {self.directory}")
+
+    def record(self, update: Dict[str, Any]) -> None:
+        """
+        Ставит обновление в очередь на запись.
+
+        Параметры:
+        - update (dict): Обновление Telegram.
+        """
+        try:
+            self._queue.put_nowait((time.time(), update))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Дописывает очередь и закрывает текущий сегмент.
+
+        Параметры:
+        - timeout (float): Сколько ждать фоновый поток в секундах; если он не успел, оставшиеся
+          в очереди обновления не записываются (поток фоновый и не задерживает остановку процесса).
+        """
+        thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Update recorder did not stop in {timeout} s, {self._queue.qsize()} updates not written")
+            return
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            logger.error(f"Update recorder did not stop in {timeout} s, {self._queue.qsize()} updates not written")
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        name = f"updates-{time.strftime('%Y%m%d-%H%M%S')}-{self._segment_seq:05d}.jsonl.gz"
+        return gzip.open(os.path.join(self.directory, name), 'wt', encoding='utf-8')
+
+    @staticmethod
+    def _close_segment(segment) -> None:
+        try:
+            segment.close()
+        except Exception as e:
+            logger.error(f"Error occurred while closing update segment: {e}")
+
+    def _write_loop(self) -> None:
+        segment = None
+        written = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                ts, update = item
+                line = json.dumps({'ts': ts, 'update': update}, ensure_ascii=False) + '\n'
+                if segment is None or written >= self.segment_bytes:
+                    if segment is not None:
+                        self._close_segment(segment)
+                        segment = None
+                    segment = self._open_segment()
+                    written = 0
+                segment.write(line)
+                written += len(line.encode('utf-8'))
+                # Сбрасываем буфер, когда очередь опустела, чтобы при падении процесса не терять записи
+                if self._queue.empty():
+                    segment.flush()
+            except Exception as e:
+                # Ошибка одной записи (например, закончилось место на диске) не останавливает поток:
+                # обновление считается пропущенным, следующее пишется в новый сегмент
+                self.dropped += 1
+                logger.error(f"Error occurred while recording update: {e}")
+                if segment is not None:
+                    self._close_segment(segment)
+                    segment = None
+        if segment is not None:
+            self._close_segment(segment)
+
+
+def read_segments(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Читает записанные обновления из сегментов по порядку.
+
+    Параметры:
+    - paths (list): Пути к сегментам или папкам с сегментами.
+
+    Возвращает:
+    - Iterator[dict]: Записи вида {"ts": ..., "update": ...}.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', '*.jsonl.gz'), recursive=True)))
+        else:
+            files.append(path)
+    for file in files:
+        opener = gzip.open if file.endswith('.gz') else open
+        with opener(file, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            # Последняя строка сегмента могла быть недописана при остановке процесса
+                            logger.warning(f"Skipping truncated record in {file}")
+            except EOFError:
+                # Сегмент не был закрыт (процесс остановлен во время записи)
+                logger.warning(f"Segment {file} is truncated")
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+from config.http import close_session
+from config.logger import logger
+from config.registry import load_bot_configs
+from db import Database, db_path
+from handler.bulk import BulkItem, BulkOperationRunner, OPERATIONS, read_items
+from handler.payment import PaymentProcessor
+
+
+async def run_bulk(args: argparse.Namespace) -> dict:
+    if args.file:
+        items = read_items(args.file)
+    else:
+        items = [BulkItem(payment_id, args.amount, args.currency) for payment_id in args.payment_ids]
+
+    # Реквизиты магазина выбранного бота из реестра
+    config = load_bot_configs()[args.bot_id]
+    payment_processor = PaymentProcessor(config.account_id, config.secret_key, config.return_url)
+
+    db = Database(db_path)
+    try:
+        runner = BulkOperationRunner(db, args.batch_id, args.operation, concurrency=args.concurrency,
+                                     payment_processor=payment_processor)
+        return await runner.run(items)
+    finally:
+        await close_session()
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовое подтверждение, отмена или возврат платежей ЮKassa")
+    parser.add_argument('operation', choices=OPERATIONS)
+    parser.add_argument('--batch-id', required=True, help="Идентификатор пакета, по нему возобновляется выполнение")
+    parser.add_argument('--file', help="CSV-файл с колонками payment_id[,amount,currency]")
+    parser.add_argument('--amount', help="Сумма для всех платежей, переданных через аргументы")
+    parser.add_argument('--currency', default="RUB")
+    parser.add_argument('--bot-id', default='default', help="Бот из реестра BOTS_CONFIG, чей магазин используется")
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--report', help="Файл для сохранения отчета в формате JSON")
+    parser.add_argument('payment_ids', nargs='*')
+    args = parser.parse_args()
+
+    if not args.file and not args.payment_ids:
+        parser.error("Укажите --file или идентификаторы платежей")
+
+    try:
+        report = asyncio.run(run_bulk(args))
+    except KeyboardInterrupt:
+        logger.info("Bulk operation interrupted, progress is saved.")
+    else:
+        report_json = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                f.write(report_json)
+        print(report_json)
@@ -0,0 +1,33 @@
+import os
+from typing import Optional
+
+import aiohttp
+
+# Общая для всех ботов процесса сессия с пулом соединений
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую HTTP-сессию, создавая ее при первом обращении.
+
+    Размер пула соединений задается переменной HTTP_POOL_SIZE (по умолчанию 100).
+
+    Возвращает:
+    - aiohttp.ClientSession: Сессия с общим пулом соединений.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=int(os.getenv('HTTP_POOL_SIZE', '100')))
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session() -> None:
+    """
+    Закрывает общую HTTP-сессию.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
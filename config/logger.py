@@ -1,3 +1,4 @@
+import contextvars
 import logging
 import sys
 import os
@@ -10,6 +11,20 @@ log_folder = 'logging'
 os.makedirs(log_folder, exist_ok=True)
 
 
+# Идентификатор корреляции текущего обновления, попадает в каждую строку лога
+correlation_id = contextvars.ContextVar('correlation_id', default='-')
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    Добавляет в запись лога идентификатор корреляции текущего обновления.
+    """
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
 # Определяем функцию для создания имени файла с учетом текущей даты
 def get_log_filename():
     current_date = datetime.datetime.now().strftime('%Y-%m-%d')
@@ -22,13 +37,14 @@ file_handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCo
 file_handler.setLevel(logging.DEBUG)
 
 # Определяем форматтер для обработчика файла
-file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(correlation_id)s] %(message)s')
 file_handler.setFormatter(file_formatter)
+file_handler.addFilter(CorrelationIdFilter())
 
 # Определяем форматтер для обработчика потока вывода
 stream_handler = logging.StreamHandler(sys.stdout)
 stream_handler.setFormatter(ColoredFormatter(
-    '%(log_color)s[%(asctime)s] - %(levelname)s: %(message)s',
+    '%(log_color)s[%(asctime)s] - %(levelname)s: [%(correlation_id)s] %(message)s',
     log_colors={
         'INFO': 'bold',
         'INFO_SUCCESS': 'green',
@@ -38,6 +54,7 @@ stream_handler.setFormatter(ColoredFormatter(
         'CRITICAL': 'red,bg_white',
     },
 ))
+stream_handler.addFilter(CorrelationIdFilter())
 
 # Создаем логгер и добавляем обработчики
 logger = logging.getLogger()
@@ -0,0 +1,131 @@
+import hashlib
+import hmac
+import json
+import os
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Тарифы по умолчанию: название -> цена в рублях
+DEFAULT_TARIFFS: Dict[str, int] = {
+    'Тариф 1': 1000,
+    'Тариф 2': 2000,
+    'Тариф 3': 3000,
+}
+
+DEFAULT_RETURN_URL = "https://t.me/test_miki323_payment_bot"
+
+
+def tariff_from_text(text: str) -> str:
+    """
+    Возвращает название тарифа из текста кнопки меню оплаты "{тариф}: {цена} RUB".
+
+    Параметры:
+    - text (str): Текст сообщения.
+
+    Возвращает:
+    - str: Название тарифа (текст без суффикса цены); есть ли такой тариф, проверяет вызывающий.
+    """
+    name, separator, price = text.rpartition(': ')
+    if separator and price.endswith(' RUB'):
+        return name.strip()
+    return text.strip()
+
+
+class BotConfig:
+    """
+    Настройки одного бота: токен Telegram, реквизиты магазина ЮKassa и набор тарифов.
+    """
+
+    def __init__(self, bot_id: str, token: str = None, base_url: str = None, account_id: str = None,
+                 secret_key: str = None, tariffs: Dict[str, int] = None, return_url: str = None,
+                 payment_flow: str = None, provider_token: str = None, webhook_secret: str = None) -> None:
+        """
+        Параметры:
+        - bot_id (str): Идентификатор бота, используется в адресе вебхука /webhook/{bot_id}.
+        - token (str, optional): Токен бота Telegram.
+        - base_url (str, optional): Адрес API бота, по умолчанию https://api.telegram.org/bot{token}.
+        - account_id (str, optional): Идентификатор магазина ЮKassa.
+        - secret_key (str, optional): Секретный ключ магазина ЮKassa.
+        - tariffs (dict, optional): Тарифы: название -> цена в рублях.
+        - return_url (str, optional): Адрес возврата после оплаты.
+        - payment_flow (str, optional): Способ оплаты: 'redirect' (ссылка ЮKassa, по умолчанию)
+          или 'invoice' (счет Telegram через sendInvoice).
+        - provider_token (str, optional): Токен платежного провайдера для счетов Telegram.
+        - webhook_secret (str, optional): Секрет вебхука (secret_token в setWebhook), который Telegram
+          передает в заголовке X-Telegram-Bot-Api-Secret-Token. По умолчанию выводится из токена бота,
+          поэтому совпадает на всех узлах.
+        """
+        self.bot_id = bot_id
+        self.token = token
+        self.base_url = base_url or f"https://api.telegram.org/bot{token}"
+        self.account_id = account_id
+        self.secret_key = secret_key
+        self.tariffs = tariffs or dict(DEFAULT_TARIFFS)
+        self.return_url = return_url or DEFAULT_RETURN_URL
+        self.payment_flow = payment_flow or 'redirect'
+        self.provider_token = provider_token
+        self.webhook_secret = webhook_secret or self.derive_webhook_secret()
+
+    def derive_webhook_secret(self) -> str:
+        """
+        Вычисляет секрет вебхука из токена бота (HMAC-SHA256), допустимый для secret_token.
+        """
+        key = (self.token or self.base_url).encode('utf-8')
+        return hmac.new(key, f"webhook:{self.bot_id}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def api_url(self, method: str) -> str:
+        """
+        Возвращает адрес метода API Telegram для этого бота, например api_url('sendMessage').
+        """
+        return f"{self.base_url}/{method}"
+
+    @classmethod
+    def from_env(cls, bot_id: str = 'default') -> 'BotConfig':
+        """
+        Создает настройки бота из переменных окружения (BASE_URL, TOKEN, ACCOUNT_ID, SECRET_KEY,
+        PAYMENT_FLOW, PROVIDER_TOKEN, WEBHOOK_SECRET).
+        """
+        return cls(bot_id=bot_id, token=os.getenv('TOKEN'), base_url=os.getenv('BASE_URL'),
+                   account_id=os.getenv('ACCOUNT_ID'), secret_key=os.getenv('SECRET_KEY'),
+                   payment_flow=os.getenv('PAYMENT_FLOW'), provider_token=os.getenv('PROVIDER_TOKEN'),
+                   webhook_secret=os.getenv('WEBHOOK_SECRET'))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BotConfig':
+        return cls(bot_id=str(data['bot_id']), token=data.get('token'), base_url=data.get('base_url'),
+                   account_id=data.get('account_id'), secret_key=data.get('secret_key'),
+                   tariffs=data.get('tariffs'), return_url=data.get('return_url'),
+                   payment_flow=data.get('payment_flow'), provider_token=data.get('provider_token'),
+                   webhook_secret=data.get('webhook_secret'))
+
+
+def load_bot_configs(path: str = None) -> Dict[str, BotConfig]:
+    """
+    Загружает реестр ботов.
+
+    Реестр — JSON-файл со списком ботов (путь задается переменной BOTS_CONFIG), например:
+    [{"bot_id": "brand1", "token": "...", "account_id": "...", "secret_key": "...",
+      "tariffs": {"Тариф 1": 1000}}]
+    Если файл не задан, возвращается один бот 'default' с настройками из переменных окружения.
+
+    Параметры:
+    - path (str, optional): Путь к файлу реестра.
+
+    Возвращает:
+    - dict: Настройки ботов по идентификатору.
+    """
+    path = path or os.getenv('BOTS_CONFIG')
+    if not path:
+        config = BotConfig.from_env()
+        return {config.bot_id: config}
+    with open(path, encoding='utf-8') as f:
+        configs = [BotConfig.from_dict(item) for item in json.load(f)]
+    registry = {}
+    for config in configs:
+        if config.bot_id in registry:
+            raise ValueError(f"Duplicate bot_id in {path}: {config.bot_id}")
+        registry[config.bot_id] = config
+    return registry
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from config.logger import logger
+
+
+class Scheduler:
+    """
+    Общий для всех ботов процесса планировщик фоновых задач.
+    """
+
+    def __init__(self, leader: Any = None) -> None:
+        """
+        Параметры:
+        - leader (LeaderElector, optional): Выбор лидера; задачи с leader_only=True выполняются
+          только пока этот узел лидер. Без него узел считается единственным.
+        """
+        self.leader = leader
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def every(self, name: str, interval: float, job: Callable[[], Awaitable], leader_only: bool = False) -> None:
+        """
+        Запускает задачу периодически: следующий запуск через interval секунд после окончания предыдущего.
+
+        Параметры:
+        - name (str): Уникальное имя задачи.
+        - interval (float): Период в секундах.
+        - job (Callable): Асинхронная функция без аргументов.
+        - leader_only (bool): Выполнять только на узле-лидере.
+        """
+        self.spawn(name, self._run_every(name, interval, job, leader_only))
+
+    def spawn(self, name: str, coro: Awaitable) -> None:
+        """
+        Запускает долгоживущую фоновую корутину.
+
+        Параметры:
+        - name (str): Уникальное имя задачи.
+        - coro (Awaitable): Корутина.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Task {name} is already scheduled")
+        self.tasks[name] = asyncio.create_task(coro)
+
+    def is_leader(self) -> bool:
+        return self.leader is None or self.leader.is_leader
+
+    async def _run_every(self, name: str, interval: float, job: Callable[[], Awaitable], leader_only: bool) -> None:
+        while True:
+            try:
+                if not leader_only or self.is_leader():
+                    await job()
+            except Exception as e:
+                logger.error(f"Error occurred in scheduled task {name}: {e}")
+            await asyncio.sleep(interval)
+
+    async def stop(self) -> None:
+        """
+        Останавливает все задачи.
+        """
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks = {}
@@ -0,0 +1,270 @@
+import asyncio
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.logger import logger, correlation_id
+
+# Трассировка текущего обновления (None, если трассировка выключена)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+
+
+class _NoopSpan:
+    """
+    Пустой участок трассировки, используется когда трассировка выключена.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    Участок трассировки: замеряет время выполнения блока кода внутри обновления.
+    """
+
+    __slots__ = ('trace', 'name', 'depth', 'start', 'duration')
+
+    def __init__(self, trace: 'Trace', name: str) -> None:
+        self.trace = trace
+        self.name = name
+        self.depth = 0
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.trace.depth -= 1
+        self.trace.spans.append(self)
+        return False
+
+
+class Trace:
+    """
+    Трассировка одного обновления Telegram: от получения до ответа.
+    """
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.depth = 0
+        self.spans: List[Span] = []
+
+    def breakdown(self) -> str:
+        """
+        Формирует разбивку времени по участкам в порядке их начала.
+
+        Возвращает:
+        - str: Строки вида "  handler: 12.3 ms", с отступом по вложенности.
+        """
+        lines = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            offset = (span.start - self.start) * 1000
+            lines.append(f"{'  ' * (span.depth + 1)}{span.name}: {span.duration * 1000:.1f} ms (+{offset:.1f} ms)")
+        return "\n".join(lines)
+
+
+class _TraceScope:
+    """
+    Контекст обработки обновления: выставляет идентификатор корреляции и, если трассировка
+    включена, собирает участки и пишет медленные обновления в лог.
+    """
+
+    __slots__ = ('tracer', 'trace_id', 'started', 'trace', '_id_token', '_trace_token')
+
+    def __init__(self, tracer: 'Tracer', trace_id: str, started: Optional[float]) -> None:
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.started = started
+        self.trace = None
+        self._id_token = None
+        self._trace_token = None
+
+    def __enter__(self):
+        self._id_token = correlation_id.set(self.trace_id)
+        if self.tracer.enabled:
+            self.trace = Trace(self.trace_id)
+            if self.started is not None:
+                self.trace.start = self.started
+            self._trace_token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            _current_trace.reset(self._trace_token)
+            self.tracer.finish(self.trace)
+        correlation_id.reset(self._id_token)
+        return False
+
+
+class Tracer:
+    """
+    Трассировка обновлений: участки, журнал медленных обновлений.
+
+    Включается переменной окружения TRACE_ENABLED=1, порог медленного обновления задается
+    переменной SLOW_UPDATE_THRESHOLD_MS (по умолчанию 1000 мс).
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = os.getenv('TRACE_ENABLED', '0') == '1'
+        self.slow_threshold: float = float(os.getenv('SLOW_UPDATE_THRESHOLD_MS', '1000')) / 1000
+
+    def trace(self, update: Optional[Dict[str, Any]] = None, started: Optional[float] = None) -> _TraceScope:
+        """
+        Открывает трассировку обновления.
+
+        Параметры:
+        - update (dict, optional): Обновление Telegram, его update_id входит в идентификатор корреляции.
+        - started (float, optional): Момент получения обновления (time.perf_counter), если оно было
+          получено раньше открытия трассировки.
+
+        Возвращает:
+        - _TraceScope: Контекстный менеджер трассировки.
+        """
+        update_id = update.get('update_id') if update else None
+        trace_id = f"{update_id}-{uuid.uuid4().hex[:8]}" if update_id is not None else uuid.uuid4().hex[:12]
+        return _TraceScope(self, trace_id, started)
+
+    @staticmethod
+    def span(name: str):
+        """
+        Открывает участок трассировки внутри текущего обновления.
+
+        Параметры:
+        - name (str): Название участка, например "telegram.sendMessage".
+
+        Возвращает:
+        - Контекстный менеджер участка (пустой, если трассировка выключена).
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            return _NOOP_SPAN
+        return Span(trace, name)
+
+    @staticmethod
+    def mark(name: str, start: float) -> None:
+        """
+        Добавляет в текущую трассировку уже завершившийся участок.
+
+        Параметры:
+        - name (str): Название участка.
+        - start (float): Момент начала участка (time.perf_counter).
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        span = Span(trace, name)
+        span.depth = trace.depth
+        span.start = start
+        span.duration = time.perf_counter() - start
+        trace.spans.append(span)
+
+    def finish(self, trace: Trace) -> None:
+        """
+        Завершает трассировку и пишет в лог разбивку, если обновление обрабатывалось дольше порога.
+
+        Параметры:
+        - trace (Trace): Завершенная трассировка.
+        """
+        total = time.perf_counter() - trace.start
+        if total >= self.slow_threshold:
+            logger.warning(f"Slow update {trace.trace_id}: {total * 1000:.1f} ms\n{trace.breakdown()}")
+
+
+tracer = Tracer()
+
+
+async def monitor_loop_lag(interval: float = None, threshold: float = None) -> None:
+    """
+    Следит за задержкой цикла событий: если цикл не просыпается вовремя, значит его
+    заблокировал синхронный код.
+
+    Параметры:
+    - interval (float, optional): Период проверки в секундах (LOOP_LAG_INTERVAL, по умолчанию 0.5).
+    - threshold (float, optional): Порог задержки в секундах (LOOP_LAG_THRESHOLD_MS, по умолчанию 100 мс).
+    """
+    if interval is None:
+        interval = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+    if threshold is None:
+        threshold = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '100')) / 1000
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = loop.time() - expected
+        if lag >= threshold:
+            logger.warning(f"Event loop lag: {lag * 1000:.1f} ms")
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик: фоновый поток периодически снимает стек потока цикла событий
+    и считает повторения. Результат выдается в свернутом формате (flamegraph collapsed stacks).
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples: Dict[Tuple[str, ...], int] = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, thread_id: int, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    async def profile(self, seconds: float) -> str:
+        """
+        Профилирует поток цикла событий в течение заданного времени.
+
+        Параметры:
+        - seconds (float): Длительность профилирования в секундах.
+
+        Возвращает:
+        - str: Стеки в свернутом формате, по одной строке "a;b;c count".
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Profiler is already running")
+        try:
+            self.samples = collections.Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stop), daemon=True)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+            lines = [f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common()]
+            return "\n".join(lines)
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
@@ -1,4 +1,5 @@
 import json
+import time
 
 
 class Message:
@@ -95,3 +96,28 @@ class Message:
             reply_markup=data.get('reply_markup'),
             parse_mode=data.get('parse_mode')
         )
+
+    @classmethod
+    def from_update(cls, update: dict, bot: any = None):
+        """
+        Создает объект сообщения из обновления Telegram.
+
+        Параметры:
+        update (dict): Обновление Telegram.
+        bot: Объект бота (по умолчанию None).
+
+        Возвращает:
+        Message: Объект сообщения или None, если обновление не содержит сообщения.
+        """
+        message_obj = update.get('message')
+        if not message_obj:
+            return None
+        return cls(
+            bot=bot,
+            chat_id=message_obj['chat']['id'],
+            message_id=message_obj['message_id'],
+            content=message_obj.get('text', 'No text'),
+            username=message_obj['from'].get('username', 'No username'),
+            user_id=message_obj['from']['id'],
+            timestamp=int(time.time())
+        )
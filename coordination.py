@@ -0,0 +1,743 @@
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.logger import logger
+from db import Database
+
+
+class ChatLockTimeout(TimeoutError):
+    """
+    Блокировку чата не удалось получить за отведенное время.
+    """
+
+
+def default_node_id() -> str:
+    """
+    Идентификатор узла: переменная окружения NODE_ID или имя хоста и номер процесса.
+    """
+    return os.getenv('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Coordinator:
+    """
+    Общее для узлов состояние и координация: заказы, значения (например, offset бота и
+    контрольные точки сверки), аренды для выбора лидера и блокировок чатов, очереди
+    отложенных проверок платежей.
+
+    Реализации: SQLiteCoordinator (локальный файл database.db) и KeyValueCoordinator
+    (сетевое хранилище ключ-значение, например Redis).
+    """
+
+    def __init__(self, node_id: str = None) -> None:
+        self.node_id = node_id or default_node_id()
+        # Локальные блокировки чатов, чтобы задачи одного узла не конкурировали за аренду
+        self._local_locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    async def insert_order(self, user_id: int, tariff: str, status: str, payment_id: str,
+                           bot_id: str = 'default') -> None:
+        """
+        Сохраняет заказ.
+
+        Параметры:
+        - user_id (int): Пользователь.
+        - tariff (str): Название тарифа.
+        - status (str): Статус заказа, например, 'pending' или 'invoiced'.
+        - payment_id (str): Идентификатор платежа ЮKassa или счета Telegram.
+        - bot_id (str): Бот, которому принадлежит заказ.
+        """
+        raise NotImplementedError
+
+    async def get_order(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает заказ по идентификатору платежа: словарь с полями payment_id, user_id, tariff,
+        status, bot_id и created_at, или None, если заказа нет.
+        """
+        raise NotImplementedError
+
+    async def get_order_statuses(self, payment_ids: List[str]) -> Dict[str, str]:
+        """
+        Возвращает статусы заказов по идентификаторам платежей (заказы, которых нет, пропускаются).
+        """
+        raise NotImplementedError
+
+    async def update_order_statuses(self, rows: List[Tuple[str, str]]) -> None:
+        """
+        Обновляет статусы заказов.
+
+        Параметры:
+        - rows (list): Пары (новый статус, идентификатор платежа).
+        """
+        raise NotImplementedError
+
+    async def update_order_payment(self, payment_id: str, new_payment_id: str, new_status: str) -> None:
+        """
+        Заменяет идентификатор платежа заказа и обновляет его статус.
+        """
+        raise NotImplementedError
+
+    async def get_orders_by_status(self, bot_id: str, status: str, since: int) -> List[Tuple]:
+        """
+        Возвращает заказы бота в статусе status, созданные не раньше since, в порядке создания.
+
+        Возвращает:
+        - list: Кортежи (payment_id, user_id, tariff, created_at).
+        """
+        raise NotImplementedError
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        Захватывает или продлевает аренду от имени этого узла.
+
+        Параметры:
+        - name (str): Имя аренды.
+        - ttl (float): Срок аренды в секундах.
+
+        Возвращает:
+        - bool: True, если аренда принадлежит этому узлу.
+        """
+        raise NotImplementedError
+
+    async def release_lease(self, name: str) -> None:
+        raise NotImplementedError
+
+    async def push_pending_check(self, queue: str, item: Dict[str, Any], due_at: float) -> None:
+        """
+        Добавляет отложенную проверку в очередь.
+
+        Параметры:
+        - queue (str): Имя очереди.
+        - item (dict): Данные проверки (сериализуются в JSON).
+        - due_at (float): Время, не раньше которого проверку нужно выполнить (time.time).
+        """
+        raise NotImplementedError
+
+    async def claim_due_checks(self, queue: str, visibility: float,
+                               limit: int = 100) -> List[Tuple[Any, Dict[str, Any]]]:
+        """
+        Забирает из очереди проверки, срок которых наступил. Каждая проверка достается только одному
+        узлу и откладывается на visibility секунд: если узел не подтвердит ее через ack_check
+        (упал или проверка не удалась), она снова станет доступна.
+
+        Параметры:
+        - queue (str): Имя очереди.
+        - visibility (float): Время на обработку проверки в секундах.
+        - limit (int): Максимальное число проверок.
+
+        Возвращает:
+        - list: Пары (квитанция для ack_check, данные проверки).
+        """
+        raise NotImplementedError
+
+    async def ack_check(self, queue: str, receipt: Any) -> None:
+        """
+        Удаляет выполненную проверку из очереди.
+
+        Параметры:
+        - queue (str): Имя очереди.
+        - receipt: Квитанция из claim_due_checks.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    @contextlib.asynccontextmanager
+    async def chat_lock(self, key: str, ttl: float = 30, timeout: float = 30):
+        """
+        Распределенная блокировка чата: обновления одного чата обрабатываются по одному на всех узлах.
+
+        Пока блокировка удерживается, аренда продлевается каждые ttl/3 секунд, поэтому долгий
+        обработчик не теряет ее; если узел упал, блокировка освобождается через ttl секунд.
+
+        Параметры:
+        - key (str): Ключ чата, например "{bot_id}:{chat_id}".
+        - ttl (float): Срок аренды блокировки в секундах.
+        - timeout (float): Сколько ждать блокировку (локальную и аренду вместе), после чего
+          выбрасывается ChatLockTimeout.
+        """
+        deadline = time.monotonic() + timeout
+        local_lock = self._local_locks.get(key)
+        if local_lock is None:
+            local_lock = asyncio.Lock()
+            self._local_locks[key] = local_lock
+        try:
+            await asyncio.wait_for(local_lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise ChatLockTimeout(f"Chat lock {key} is busy on this node") from None
+        try:
+            name = f"chat:{key}"
+            delay = 0.01
+            while not await self.acquire_lease(name, ttl):
+                if time.monotonic() >= deadline:
+                    raise ChatLockTimeout(f"Chat lock {key} is busy")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            # Продление останавливается событием, а не отменой задачи: отмена посреди запроса
+            # к хранилищу может оставить соединение в неопределенном состоянии
+            stop = asyncio.Event()
+            renewal = asyncio.create_task(self._renew_lease(name, ttl, stop))
+            try:
+                yield
+            finally:
+                stop.set()
+                await renewal
+                await self.release_lease(name)
+        finally:
+            local_lock.release()
+
+    async def _renew_lease(self, name: str, ttl: float, stop: asyncio.Event) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), ttl / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                if not await self.acquire_lease(name, ttl):
+                    logger.warning(f"Lease {name} was lost by node {self.node_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Error occurred while renewing lease {name}: {e}")
+
+
+class SQLiteCoordinator(Coordinator):
+    """
+    Координация через локальную базу SQLite. Подходит для одного узла или нескольких
+    процессов на одном хосте с общим файлом базы; узлам на разных хостах нужен
+    KeyValueCoordinator.
+    """
+
+    def __init__(self, db: Database, node_id: str = None) -> None:
+        super().__init__(node_id)
+        self.db = db
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.db.get_sync_state(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self.db.set_sync_state(key, value)
+
+    async def insert_order(self, user_id: int, tariff: str, status: str, payment_id: str,
+                           bot_id: str = 'default') -> None:
+        self.db.insert_order(user_id, tariff, status, payment_id=payment_id, bot_id=bot_id)
+
+    async def get_order(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.get_order(payment_id)
+        if row is None:
+            return None
+        return dict(zip(('payment_id', 'user_id', 'tariff', 'status', 'bot_id', 'created_at'), row))
+
+    async def get_order_statuses(self, payment_ids: List[str]) -> Dict[str, str]:
+        return self.db.get_order_statuses_by_payment_ids(payment_ids)
+
+    async def update_order_statuses(self, rows: List[Tuple[str, str]]) -> None:
+        self.db.update_order_statuses(rows)
+
+    async def update_order_payment(self, payment_id: str, new_payment_id: str, new_status: str) -> None:
+        self.db.update_order_payment(payment_id, new_payment_id, new_status)
+
+    async def get_orders_by_status(self, bot_id: str, status: str, since: int) -> List[Tuple]:
+        return self.db.get_orders_by_status(bot_id, status, since)
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        return self.db.acquire_lease(name, self.node_id, ttl)
+
+    async def release_lease(self, name: str) -> None:
+        self.db.release_lease(name, self.node_id)
+
+    async def push_pending_check(self, queue: str, item: Dict[str, Any], due_at: float) -> None:
+        self.db.push_pending_check(queue, json.dumps(item, ensure_ascii=False), due_at)
+
+    async def claim_due_checks(self, queue: str, visibility: float,
+                               limit: int = 100) -> List[Tuple[Any, Dict[str, Any]]]:
+        return [(check_id, json.loads(item))
+                for check_id, item in self.db.claim_due_checks(queue, time.time(), visibility, limit)]
+
+    async def ack_check(self, queue: str, receipt: Any) -> None:
+        self.db.delete_pending_check(receipt)
+
+
+class KeyValueStore:
+    """
+    Минимальный набор операций сетевого хранилища ключ-значение, нужный для координации.
+    Все операции атомарны.
+    """
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def compare_and_set(self, key: str, expected: str, value: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def compare_and_delete(self, key: str, expected: str) -> bool:
+        raise NotImplementedError
+
+    async def zadd(self, name: str, member: str, score: float) -> None:
+        raise NotImplementedError
+
+    async def zclaim_due(self, name: str, max_score: float, new_score: float, limit: int) -> List[str]:
+        """
+        Атомарно переносит элементы с оценкой не больше max_score на оценку new_score и возвращает их.
+        """
+        raise NotImplementedError
+
+    async def zrem(self, name: str, member: str) -> None:
+        raise NotImplementedError
+
+    async def zrange_by_score(self, name: str, min_score: float, max_score: float) -> List[str]:
+        """
+        Возвращает элементы с оценкой от min_score до max_score в порядке возрастания оценки.
+        """
+        raise NotImplementedError
+
+    async def apply_if_unchanged(self, expected: Dict[str, Optional[str]], sets: Dict[str, str] = None,
+                                 deletes: List[str] = None, zadds: List[Tuple[str, str, float]] = None,
+                                 zrems: List[Tuple[str, str]] = None) -> bool:
+        """
+        Атомарно применяет набор изменений, если значения ключей expected не изменились
+        (оптимистическая транзакция, как WATCH/MULTI).
+
+        Параметры:
+        - expected (dict): Ожидаемые значения ключей (None — ключа нет).
+        - sets (dict, optional): Ключи и новые значения.
+        - deletes (list, optional): Удаляемые ключи.
+        - zadds (list, optional): Тройки (множество, элемент, оценка) для добавления.
+        - zrems (list, optional): Пары (множество, элемент) для удаления.
+
+        Возвращает:
+        - bool: True, если изменения применены, False если какой-либо ключ из expected изменился.
+
+        Изменения применяются в порядке: zrems, sets, deletes, zadds.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStore(KeyValueStore):
+    """
+    Хранилище ключ-значение в памяти процесса. Заменяет сетевое хранилище в тестах;
+    несколько KeyValueCoordinator с одним LocalStore ведут себя как узлы с общим хранилищем.
+    """
+
+    def __init__(self) -> None:
+        self._values: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._sorted: Dict[str, Dict[str, float]] = {}
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._values.get(key) if self._alive(key) else None
+
+    async def set(self, key: str, value: str) -> None:
+        self._values[key] = value
+        self._expires.pop(key, None)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+        self._expires.pop(key, None)
+
+    async def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        if self._alive(key):
+            return False
+        self._values[key] = value
+        self._expires[key] = time.monotonic() + ttl
+        return True
+
+    async def compare_and_set(self, key: str, expected: str, value: str, ttl: float) -> bool:
+        if not self._alive(key) or self._values[key] != expected:
+            return False
+        self._values[key] = value
+        self._expires[key] = time.monotonic() + ttl
+        return True
+
+    async def compare_and_delete(self, key: str, expected: str) -> bool:
+        if not self._alive(key) or self._values[key] != expected:
+            return False
+        del self._values[key]
+        self._expires.pop(key, None)
+        return True
+
+    async def zadd(self, name: str, member: str, score: float) -> None:
+        self._sorted.setdefault(name, {})[member] = score
+
+    async def zclaim_due(self, name: str, max_score: float, new_score: float, limit: int) -> List[str]:
+        members = self._sorted.get(name, {})
+        due = sorted((score, member) for member, score in members.items() if score <= max_score)[:limit]
+        for _, member in due:
+            members[member] = new_score
+        return [member for _, member in due]
+
+    async def zrem(self, name: str, member: str) -> None:
+        self._sorted.get(name, {}).pop(member, None)
+
+    async def zrange_by_score(self, name: str, min_score: float, max_score: float) -> List[str]:
+        members = self._sorted.get(name, {})
+        return [member for score, member in sorted((score, member) for member, score in members.items())
+                if min_score <= score <= max_score]
+
+    async def apply_if_unchanged(self, expected: Dict[str, Optional[str]], sets: Dict[str, str] = None,
+                                 deletes: List[str] = None, zadds: List[Tuple[str, str, float]] = None,
+                                 zrems: List[Tuple[str, str]] = None) -> bool:
+        for key, value in expected.items():
+            if await self.get(key) != value:
+                return False
+        for name, member in zrems or []:
+            await self.zrem(name, member)
+        for key, value in (sets or {}).items():
+            await self.set(key, value)
+        for key in deletes or []:
+            await self.delete(key)
+        for name, member, score in zadds or []:
+            await self.zadd(name, member, score)
+        return True
+
+
+class RedisStore(KeyValueStore):
+    """
+    Хранилище ключ-значение в Redis (нужен пакет redis).
+    """
+
+    _compare_and_set_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+            return 1
+        end
+        return 0
+    """
+    _compare_and_delete_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    _claim_due_script = """
+        local members = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+        for _, member in ipairs(members) do
+            redis.call('zadd', KEYS[1], 'XX', ARGV[2], member)
+        end
+        return members
+    """
+    # ARGV[1] — JSON с изменениями, где ключи заданы номерами в KEYS
+    _apply_if_unchanged_script = """
+        local ops = cjson.decode(ARGV[1])
+        for _, item in ipairs(ops['expected']) do
+            local value = redis.call('get', KEYS[item[1]])
+            if item[2] == cjson.null then
+                if value then
+                    return 0
+                end
+            elseif value ~= item[2] then
+                return 0
+            end
+        end
+        for _, item in ipairs(ops['zrem']) do
+            redis.call('zrem', KEYS[item[1]], item[2])
+        end
+        for _, item in ipairs(ops['set']) do
+            redis.call('set', KEYS[item[1]], item[2])
+        end
+        for _, item in ipairs(ops['del']) do
+            redis.call('del', KEYS[item])
+        end
+        for _, item in ipairs(ops['zadd']) do
+            redis.call('zadd', KEYS[item[1]], item[3], item[2])
+        end
+        return 1
+    """
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError("RedisStore requires the redis package: pip install redis")
+        self.client = redis.from_url(url, decode_responses=True)
+        self._compare_and_set = self.client.register_script(self._compare_and_set_script)
+        self._compare_and_delete = self.client.register_script(self._compare_and_delete_script)
+        self._claim_due = self.client.register_script(self._claim_due_script)
+        self._apply_if_unchanged = self.client.register_script(self._apply_if_unchanged_script)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        await self.client.set(key, value)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.client.mget(keys) if keys else []
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        return bool(await self.client.set(key, value, nx=True, px=int(ttl * 1000)))
+
+    async def compare_and_set(self, key: str, expected: str, value: str, ttl: float) -> bool:
+        return bool(await self._compare_and_set(keys=[key], args=[expected, value, int(ttl * 1000)]))
+
+    async def compare_and_delete(self, key: str, expected: str) -> bool:
+        return bool(await self._compare_and_delete(keys=[key], args=[expected]))
+
+    async def zadd(self, name: str, member: str, score: float) -> None:
+        await self.client.zadd(name, {member: score})
+
+    async def zclaim_due(self, name: str, max_score: float, new_score: float, limit: int) -> List[str]:
+        return await self._claim_due(keys=[name], args=[max_score, new_score, limit])
+
+    async def zrem(self, name: str, member: str) -> None:
+        await self.client.zrem(name, member)
+
+    async def zrange_by_score(self, name: str, min_score: float, max_score: float) -> List[str]:
+        return await self.client.zrangebyscore(name, min_score, max_score)
+
+    async def apply_if_unchanged(self, expected: Dict[str, Optional[str]], sets: Dict[str, str] = None,
+                                 deletes: List[str] = None, zadds: List[Tuple[str, str, float]] = None,
+                                 zrems: List[Tuple[str, str]] = None) -> bool:
+        # Все ключи передаются в KEYS, как того требует Redis для скриптов
+        keys: List[str] = []
+        positions: Dict[str, int] = {}
+
+        def position(key: str) -> int:
+            if key not in positions:
+                keys.append(key)
+                positions[key] = len(keys)
+            return positions[key]
+
+        ops = {
+            'expected': [[position(key), value] for key, value in expected.items()],
+            'zrem': [[position(name), member] for name, member in zrems or []],
+            'set': [[position(key), value] for key, value in (sets or {}).items()],
+            'del': [position(key) for key in deletes or []],
+            'zadd': [[position(name), member, repr(float(score))] for name, member, score in zadds or []],
+        }
+        return bool(await self._apply_if_unchanged(keys=keys, args=[json.dumps(ops, ensure_ascii=False)]))
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class KeyValueCoordinator(Coordinator):
+    """
+    Координация через сетевое хранилище ключ-значение, общее для всех узлов.
+
+    Заказ хранится в JSON под ключом order:{payment_id}; для выборки по статусу заказы
+    дополнительно индексируются в упорядоченных множествах orders:{bot_id}:{status}
+    по времени создания. Заказ и индекс изменяются вместе одной оптимистической транзакцией
+    (KeyValueStore.apply_if_unchanged): пакет заказов читается одним запросом и записывается
+    другим, а если какой-либо заказ тем временем изменил другой узел, пакет перечитывается.
+    """
+
+    # Сколько раз повторять транзакцию, если заказы изменились между чтением и записью
+    max_retries = 10
+
+    def __init__(self, store: KeyValueStore, node_id: str = None, prefix: str = 'hrbot:') -> None:
+        super().__init__(node_id)
+        self.store = store
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.store.get(self.prefix + key)
+
+    async def set(self, key: str, value: str) -> None:
+        await self.store.set(self.prefix + key, value)
+
+    def _order_key(self, payment_id: str) -> str:
+        return f"{self.prefix}order:{payment_id}"
+
+    def _status_index(self, bot_id: str, status: str) -> str:
+        return f"{self.prefix}orders:{bot_id}:{status}"
+
+    async def insert_order(self, user_id: int, tariff: str, status: str, payment_id: str,
+                           bot_id: str = 'default') -> None:
+        order = {'payment_id': payment_id, 'user_id': user_id, 'tariff': tariff, 'status': status,
+                 'bot_id': bot_id, 'created_at': int(time.time())}
+        await self.store.apply_if_unchanged(
+            {}, sets={self._order_key(payment_id): json.dumps(order, ensure_ascii=False)},
+            zadds=[(self._status_index(bot_id, status), payment_id, order['created_at'])])
+
+    async def get_order(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        order = await self.store.get(self._order_key(payment_id))
+        return json.loads(order) if order is not None else None
+
+    async def get_order_statuses(self, payment_ids: List[str]) -> Dict[str, str]:
+        orders = await self.store.mget([self._order_key(payment_id) for payment_id in payment_ids])
+        statuses = {}
+        for order in orders:
+            if order is not None:
+                order = json.loads(order)
+                statuses[order['payment_id']] = order['status']
+        return statuses
+
+    async def update_order_statuses(self, rows: List[Tuple[str, str]]) -> None:
+        statuses = {payment_id: status for status, payment_id in rows}
+        keys = [self._order_key(payment_id) for payment_id in statuses]
+        for _ in range(self.max_retries):
+            expected, sets, zadds, zrems = {}, {}, [], []
+            for key, raw in zip(keys, await self.store.mget(keys)):
+                expected[key] = raw
+                if raw is None:
+                    continue
+                order = json.loads(raw)
+                payment_id, status = order['payment_id'], statuses[order['payment_id']]
+                if order['status'] == status:
+                    continue
+                zrems.append((self._status_index(order['bot_id'], order['status']), payment_id))
+                order['status'] = status
+                sets[key] = json.dumps(order, ensure_ascii=False)
+                zadds.append((self._status_index(order['bot_id'], status), payment_id, order['created_at']))
+            if not sets:
+                return
+            if await self.store.apply_if_unchanged(expected, sets=sets, zadds=zadds, zrems=zrems):
+                return
+        raise RuntimeError(f"Orders were changed concurrently {self.max_retries} times, statuses not updated")
+
+    async def update_order_payment(self, payment_id: str, new_payment_id: str, new_status: str) -> None:
+        key, new_key = self._order_key(payment_id), self._order_key(new_payment_id)
+        for _ in range(self.max_retries):
+            raw, new_raw = await self.store.mget([key, new_key])
+            if raw is None:
+                return
+            order = json.loads(raw)
+            old_status = order['status']
+            order.update(payment_id=new_payment_id, status=new_status)
+            if await self.store.apply_if_unchanged(
+                    {key: raw, new_key: new_raw},
+                    sets={new_key: json.dumps(order, ensure_ascii=False)},
+                    deletes=[key] if new_payment_id != payment_id else [],
+                    zrems=[(self._status_index(order['bot_id'], old_status), payment_id)],
+                    zadds=[(self._status_index(order['bot_id'], new_status), new_payment_id, order['created_at'])]):
+                return
+        raise RuntimeError(f"Order {payment_id} was changed concurrently {self.max_retries} times, not updated")
+
+    async def get_orders_by_status(self, bot_id: str, status: str, since: int) -> List[Tuple]:
+        payment_ids = await self.store.zrange_by_score(self._status_index(bot_id, status), since, float('inf'))
+        orders = await self.store.mget([self._order_key(payment_id) for payment_id in payment_ids])
+        rows = []
+        for order in orders:
+            if order is not None:
+                order = json.loads(order)
+                if order['status'] == status and order['bot_id'] == bot_id:
+                    rows.append((order['payment_id'], order['user_id'], order['tariff'], order['created_at']))
+        return rows
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        key = f"{self.prefix}lease:{name}"
+        if await self.store.compare_and_set(key, self.node_id, self.node_id, ttl):
+            return True
+        return await self.store.set_if_absent(key, self.node_id, ttl)
+
+    async def release_lease(self, name: str) -> None:
+        await self.store.compare_and_delete(f"{self.prefix}lease:{name}", self.node_id)
+
+    async def push_pending_check(self, queue: str, item: Dict[str, Any], due_at: float) -> None:
+        await self.store.zadd(f"{self.prefix}queue:{queue}", json.dumps(item, ensure_ascii=False), due_at)
+
+    async def claim_due_checks(self, queue: str, visibility: float,
+                               limit: int = 100) -> List[Tuple[Any, Dict[str, Any]]]:
+        now = time.time()
+        items = await self.store.zclaim_due(f"{self.prefix}queue:{queue}", now, now + visibility, limit)
+        return [(item, json.loads(item)) for item in items]
+
+    async def ack_check(self, queue: str, receipt: Any) -> None:
+        await self.store.zrem(f"{self.prefix}queue:{queue}", receipt)
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def create_coordinator(db: Database, node_id: str = None) -> Coordinator:
+    """
+    Создает координатор по переменной окружения COORDINATION_BACKEND:
+    'sqlite' (по умолчанию, локальная база), 'redis' (адрес в REDIS_URL) или 'local'
+    (хранилище в памяти процесса).
+
+    Параметры:
+    - db (Database): Локальная база данных для варианта 'sqlite'.
+    - node_id (str, optional): Идентификатор узла.
+
+    Возвращает:
+    - Coordinator: Координатор.
+    """
+    backend = os.getenv('COORDINATION_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteCoordinator(db, node_id)
+    if backend == 'redis':
+        return KeyValueCoordinator(RedisStore(os.getenv('REDIS_URL', 'redis://localhost:6379/0')), node_id)
+    if backend == 'local':
+        return KeyValueCoordinator(LocalStore(), node_id)
+    raise ValueError(f"Unknown coordination backend: {backend}")
+
+
+class LeaderElector:
+    """
+    Выбор лидера через аренду: лидер продлевает аренду каждые ttl/3 секунд, при падении
+    лидера аренду через ttl секунд забирает другой узел. Задачи, которые должны выполняться
+    на одном узле (опрос обновлений, проверки платежей, сверка), проверяют is_leader.
+    """
+
+    def __init__(self, coordinator: Coordinator, name: str = 'leader', ttl: float = None) -> None:
+        """
+        Параметры:
+        - coordinator (Coordinator): Координатор.
+        - name (str): Имя аренды лидера.
+        - ttl (float, optional): Срок аренды в секундах (LEADER_TTL, по умолчанию 15).
+        """
+        self.coordinator = coordinator
+        self.name = name
+        self.ttl = ttl if ttl is not None else float(os.getenv('LEADER_TTL', '15'))
+        self.is_leader = False
+
+    async def run(self) -> None:
+        """
+        Периодически захватывает или продлевает аренду лидера.
+        """
+        try:
+            while True:
+                try:
+                    leader = await self.coordinator.acquire_lease(self.name, self.ttl)
+                except Exception as e:
+                    logger.error(f"Error occurred during leader election: {e}")
+                    leader = False
+                if leader != self.is_leader:
+                    logger.info(f"Node {self.coordinator.node_id} "
+                                f"{'became the leader' if leader else 'is no longer the leader'}")
+                self.is_leader = leader
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                await self.coordinator.release_lease(self.name)
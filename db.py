@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import time
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(BASE_DIR, 'database.db')
@@ -19,10 +20,67 @@ class Database:
                 status TEXT
             )
         ''')
+
+        # Добавляем колонки, появившиеся позже, в уже существующую таблицу заказов
+        columns = {row[1] for row in self.cur.execute('PRAGMA table_info(orders)').fetchall()}
+        if 'payment_id' not in columns:
+            self.cur.execute('ALTER TABLE orders ADD COLUMN payment_id TEXT')
+        if 'created_at' not in columns:
+            self.cur.execute('ALTER TABLE orders ADD COLUMN created_at INTEGER')
+        if 'bot_id' not in columns:
+            self.cur.execute("ALTER TABLE orders ADD COLUMN bot_id TEXT DEFAULT 'default'")
+        self.cur.execute('CREATE INDEX IF NOT EXISTS idx_orders_payment_id ON orders (payment_id)')
+
+        # Создаем таблицу для состояния фоновых задач (контрольные точки сверки и т.п.)
+        self.cur.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        # Создаем таблицы для координации узлов: аренды (лидер, блокировки чатов) и отложенные проверки платежей
+        self.cur.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL
+            )
+        ''')
+        self.cur.execute('''
+            CREATE TABLE IF NOT EXISTS pending_checks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT,
+                due_at REAL,
+                item TEXT
+            )
+        ''')
+        self.cur.execute('CREATE INDEX IF NOT EXISTS idx_pending_checks_due ON pending_checks (queue, due_at)')
+
+        # Создаем таблицу для контрольных точек массовых операций с платежами
+        self.cur.execute('''
+            CREATE TABLE IF NOT EXISTS bulk_operations (
+                batch_id TEXT,
+                payment_id TEXT,
+                operation TEXT,
+                status TEXT,
+                error TEXT,
+                updated_at INTEGER,
+                PRIMARY KEY (batch_id, payment_id)
+            )
+        ''')
+        columns = {row[1] for row in self.cur.execute('PRAGMA table_info(bulk_operations)').fetchall()}
+        if 'attempt' not in columns:
+            self.cur.execute('ALTER TABLE bulk_operations ADD COLUMN attempt INTEGER DEFAULT 0')
+        if 'key_created_at' not in columns:
+            # Время первого запроса с текущим ключом идемпотентности
+            self.cur.execute('ALTER TABLE bulk_operations ADD COLUMN key_created_at INTEGER')
         self.conn.commit()
 
-    def insert_order(self, user_id, tariff, status):
-        self.cur.execute('INSERT INTO orders (user_id, tariff, status) VALUES (?, ?, ?)', (user_id, tariff, status))
+    def insert_order(self, user_id, tariff, status, payment_id=None, bot_id='default'):
+        self.cur.execute('INSERT INTO orders (user_id, tariff, status, payment_id, created_at, bot_id) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (user_id, tariff, status, payment_id, int(time.time()), bot_id))
         self.conn.commit()
 
     def get_order_status(self, user_id):
@@ -36,5 +94,96 @@ class Database:
         self.cur.execute('UPDATE orders SET status=? WHERE user_id=?', (new_status, user_id))
         self.conn.commit()
 
+    def get_order(self, payment_id):
+        self.cur.execute('SELECT payment_id, user_id, tariff, status, bot_id, created_at FROM orders '
+                         'WHERE payment_id=? ORDER BY id DESC LIMIT 1', (payment_id,))
+        return self.cur.fetchone()
+
+    def get_order_statuses_by_payment_ids(self, payment_ids):
+        if not payment_ids:
+            return {}
+        placeholders = ', '.join('?' * len(payment_ids))
+        self.cur.execute(f'SELECT payment_id, status FROM orders WHERE payment_id IN ({placeholders})',
+                         tuple(payment_ids))
+        return dict(self.cur.fetchall())
+
+    def update_order_statuses(self, rows):
+        # rows: (new_status, payment_id)
+        self.cur.executemany('UPDATE orders SET status=? WHERE payment_id=?', rows)
+        self.conn.commit()
+
+    def update_order_payment(self, payment_id, new_payment_id, new_status):
+        self.cur.execute('UPDATE orders SET payment_id=?, status=? WHERE payment_id=?',
+                         (new_payment_id, new_status, payment_id))
+        self.conn.commit()
+
+    def get_orders_by_status(self, bot_id, status, since):
+        self.cur.execute('SELECT payment_id, user_id, tariff, created_at FROM orders '
+                         'WHERE bot_id=? AND status=? AND created_at>=? ORDER BY created_at',
+                         (bot_id, status, since))
+        return self.cur.fetchall()
+
+    def get_sync_state(self, name):
+        self.cur.execute('SELECT value FROM sync_state WHERE name=?', (name,))
+        row = self.cur.fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def set_sync_state(self, name, value):
+        self.cur.execute('INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)', (name, value))
+        self.conn.commit()
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        self.cur.execute('INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                         (name, owner, now + ttl))
+        if self.cur.rowcount != 1:
+            # Продлеваем свою аренду или забираем просроченную
+            self.cur.execute('UPDATE leases SET owner=?, expires_at=? WHERE name=? AND (owner=? OR expires_at<?)',
+                             (owner, now + ttl, name, owner, now))
+        acquired = self.cur.rowcount == 1
+        self.conn.commit()
+        return acquired
+
+    def release_lease(self, name, owner):
+        self.cur.execute('DELETE FROM leases WHERE name=? AND owner=?', (name, owner))
+        self.conn.commit()
+
+    def push_pending_check(self, queue, item, due_at):
+        self.cur.execute('INSERT INTO pending_checks (queue, due_at, item) VALUES (?, ?, ?)', (queue, due_at, item))
+        self.conn.commit()
+
+    def claim_due_checks(self, queue, now, visibility, limit):
+        self.cur.execute('SELECT id, item FROM pending_checks WHERE queue=? AND due_at<=? ORDER BY due_at LIMIT ?',
+                         (queue, now, limit))
+        claimed = []
+        for check_id, item in self.cur.fetchall():
+            # Откладываем проверку на время обработки; забираем только те, которые отложили сами
+            self.cur.execute('UPDATE pending_checks SET due_at=? WHERE id=? AND due_at<=?',
+                             (now + visibility, check_id, now))
+            if self.cur.rowcount == 1:
+                claimed.append((check_id, item))
+        self.conn.commit()
+        return claimed
+
+    def delete_pending_check(self, check_id):
+        self.cur.execute('DELETE FROM pending_checks WHERE id=?', (check_id,))
+        self.conn.commit()
+
+    def get_bulk_progress(self, batch_id):
+        # payment_id -> (status, attempt, key_created_at); для записей без key_created_at — updated_at
+        self.cur.execute('SELECT payment_id, status, attempt, COALESCE(key_created_at, updated_at) '
+                         'FROM bulk_operations WHERE batch_id=?', (batch_id,))
+        return {payment_id: (status, attempt or 0, key_created_at)
+                for payment_id, status, attempt, key_created_at in self.cur.fetchall()}
+
+    def save_bulk_results(self, rows):
+        # rows: (batch_id, payment_id, operation, status, error, updated_at, attempt, key_created_at)
+        self.cur.executemany('INSERT OR REPLACE INTO bulk_operations '
+                             '(batch_id, payment_id, operation, status, error, updated_at, attempt, key_created_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+
     def close(self):
         self.conn.close()
@@ -0,0 +1,206 @@
+import collections
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config.logger import logger
+from config.registry import DEFAULT_TARIFFS, tariff_from_text
+from config.types import Message
+
+# Решения контроля доступа
+ADMIT = 'admit'
+COALESCED = 'coalesced'
+THROTTLED = 'throttled'
+SHED = 'shed'
+
+# Ключ команды оплаты: выбор любого тарифа считается одной командой
+PAYMENT_COMMAND = 'tariff'
+
+
+class TokenBuckets:
+    """
+    Набор корзин токенов с ключом произвольного вида.
+
+    Состояние корзины хранится в списке [токены, время последнего пополнения] внутри OrderedDict,
+    порядок которого соответствует давности обращения: при превышении max_keys вытесняются
+    самые давно не использованные корзины.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int) -> None:
+        """
+        Параметры:
+        - rate (float): Скорость пополнения, токенов в секунду.
+        - burst (float): Емкость корзины (допустимый всплеск запросов).
+        - max_keys (int): Максимальное число хранимых корзин.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: 'collections.OrderedDict[Tuple, list]' = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def consume(self, key: Tuple, now: float, cost: float = 1.0) -> bool:
+        """
+        Списывает токены из корзины.
+
+        Параметры:
+        - key (tuple): Ключ корзины, например (user_id,) или (user_id, command).
+        - now (float): Текущее время (AdmissionController.clock).
+        - cost (float): Стоимость запроса в токенах.
+
+        Возвращает:
+        - bool: True, если токенов хватило, False если запрос нужно ограничить.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+
+class AdmissionController:
+    """
+    Контроль доступа перед обработкой команд: ограничение частоты запросов пользователя
+    и отдельных команд, склейка повторных одинаковых запросов и сброс некритичных команд
+    при перегрузке.
+
+    Настраивается переменными окружения:
+    - THROTTLE_USER_RATE / THROTTLE_USER_BURST: общий лимит пользователя (по умолчанию 1/с, всплеск 5).
+    - THROTTLE_PAYMENT_RATE / THROTTLE_PAYMENT_BURST: лимит на создание платежей (по умолчанию 1 за 30 с, всплеск 2).
+    - THROTTLE_MAX_KEYS: максимальное число хранимых корзин (по умолчанию 10000).
+    - COALESCE_WINDOW: окно склейки одинаковых запросов в секундах (по умолчанию 2).
+    - SHED_QUEUE_THRESHOLD: число обрабатываемых обновлений, после которого сбрасываются
+      некритичные команды (по умолчанию 100).
+    """
+
+    # Команды, которые не сбрасываются при перегрузке (кроме выбора тарифа)
+    critical_commands = ("/start", "Оплатить подписку")
+
+    def __init__(self, tariffs: Iterable[str] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Параметры:
+        - tariffs (Iterable, optional): Названия тарифов бота, по умолчанию DEFAULT_TARIFFS. Выбор тарифа
+          ограничивается корзиной платежей и не сбрасывается при перегрузке.
+        - clock (Callable, optional): Источник времени в секундах, по умолчанию time.monotonic.
+        """
+        self.tariffs = frozenset(tariffs if tariffs is not None else DEFAULT_TARIFFS)
+        self.clock = clock
+        max_keys = int(os.getenv('THROTTLE_MAX_KEYS', '10000'))
+        self.user_buckets = TokenBuckets(rate=float(os.getenv('THROTTLE_USER_RATE', '1')),
+                                         burst=float(os.getenv('THROTTLE_USER_BURST', '5')),
+                                         max_keys=max_keys)
+        self.payment_buckets = TokenBuckets(rate=float(os.getenv('THROTTLE_PAYMENT_RATE', str(1 / 30))),
+                                            burst=float(os.getenv('THROTTLE_PAYMENT_BURST', '2')),
+                                            max_keys=max_keys)
+        self.coalesce_window: float = float(os.getenv('COALESCE_WINDOW', '2'))
+        self.shed_threshold: int = int(os.getenv('SHED_QUEUE_THRESHOLD', '100'))
+        self.max_keys = max_keys
+        self.in_flight: int = 0
+        self.stats: Dict[str, int] = collections.Counter()
+        # Последние запросы: (user_id, текст) -> время, в порядке поступления
+        self._recent: 'collections.OrderedDict[Tuple, float]' = collections.OrderedDict()
+        # Время последнего отправленного отказа пользователю, чтобы не отвечать на каждый запрос
+        self._notified: 'collections.OrderedDict[int, float]' = collections.OrderedDict()
+
+    def command_key(self, message: Message) -> str:
+        """
+        Возвращает ключ команды для корзин: все тарифы считаются одной командой оплаты.
+        """
+        content = message.content or ''
+        return PAYMENT_COMMAND if tariff_from_text(content) in self.tariffs else content
+
+    def is_critical(self, command: str) -> bool:
+        return command == PAYMENT_COMMAND or command.startswith(self.critical_commands)
+
+    def _coalesce(self, key: Tuple, now: float) -> bool:
+        # Удаляем устаревшие записи с начала очереди
+        recent = self._recent
+        while recent:
+            _, seen = next(iter(recent.items()))
+            if now - seen < self.coalesce_window and len(recent) <= self.max_keys:
+                break
+            recent.popitem(last=False)
+        if key in recent:
+            return True
+        recent[key] = now
+        return False
+
+    def admit(self, message: Message) -> str:
+        """
+        Принимает решение о допуске сообщения к обработке.
+
+        Параметры:
+        - message (Message): Входящее сообщение.
+
+        Возвращает:
+        - str: ADMIT, COALESCED, THROTTLED или SHED.
+        """
+        now = self.clock()
+        user_id = message.user_id if message.user_id is not None else message.chat_id
+        command = self.command_key(message)
+
+        if self._coalesce((user_id, message.content), now):
+            decision = COALESCED
+        elif self.in_flight >= self.shed_threshold and not self.is_critical(command):
+            decision = SHED
+        elif not self.user_buckets.consume((user_id,), now):
+            decision = THROTTLED
+        elif command == PAYMENT_COMMAND and not self.payment_buckets.consume((user_id, command), now):
+            decision = THROTTLED
+        else:
+            decision = ADMIT
+
+        self.stats[decision] += 1
+        if decision != ADMIT:
+            logger.info(f"Admission {decision} for user {user_id}: {message.content}")
+        return decision
+
+    def forget(self, message: Message) -> None:
+        """
+        Забывает допущенное сообщение, которое не удалось обработать, чтобы его повторная доставка
+        не была склеена с ним.
+
+        Параметры:
+        - message (Message): Сообщение, допущенное admit.
+        """
+        user_id = message.user_id if message.user_id is not None else message.chat_id
+        self._recent.pop((user_id, message.content), None)
+
+    def should_notify(self, chat_id: int) -> bool:
+        """
+        Проверяет, нужно ли отправить пользователю отказ: не чаще одного раза за окно склейки.
+
+        Параметры:
+        - chat_id (int): Идентификатор чата.
+
+        Возвращает:
+        - bool: True, если отказ можно отправить.
+        """
+        now = self.clock()
+        last = self._notified.get(chat_id)
+        if last is not None and now - last < self.coalesce_window:
+            return False
+        self._notified[chat_id] = now
+        self._notified.move_to_end(chat_id)
+        if len(self._notified) > self.max_keys:
+            self._notified.popitem(last=False)
+        return True
+
+
+# Готовые ответы при отказе (склеенные запросы остаются без ответа)
+CANNED_REPLIES: Dict[str, Optional[str]] = {
+    COALESCED: None,
+    THROTTLED: "Слишком много запросов. Пожалуйста, подождите немного и попробуйте снова.",
+    SHED: "Бот сейчас перегружен. Пожалуйста, попробуйте позже.",
+}
@@ -0,0 +1,255 @@
+import asyncio
+import csv
+import time
+import uuid
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from config.logger import logger
+from db import Database
+from handler.payment import PaymentProcessor, YooKassaError
+
+# Пространство имен для детерминированных ключей идемпотентности
+IDEMPOTENCE_NAMESPACE = uuid.UUID('6f1c2a8e-3b7d-4c55-9e0a-2d4f8b1c7e93')
+
+OPERATIONS = ('capture', 'cancel', 'refund')
+
+# Сколько ЮKassa помнит ключ идемпотентности, в секундах
+IDEMPOTENCE_KEY_TTL = 24 * 60 * 60
+
+
+class BulkItem:
+    """
+    Платеж, над которым выполняется массовая операция.
+    """
+
+    __slots__ = ('payment_id', 'amount', 'currency')
+
+    def __init__(self, payment_id: str, amount: str = None, currency: str = "RUB") -> None:
+        self.payment_id = payment_id
+        self.amount = amount
+        self.currency = currency or "RUB"
+
+
+def read_items(path: str) -> List[BulkItem]:
+    """
+    Читает список платежей из CSV-файла.
+
+    Файл должен содержать заголовок с колонкой payment_id и, при необходимости, колонками
+    amount и currency (для возвратов и частичного подтверждения). Файл без заголовка
+    читается как список идентификаторов платежей по одному в строке. Метка порядка байтов
+    (BOM), которую добавляет Excel, пропускается.
+
+    Параметры:
+    - path (str): Путь к файлу.
+
+    Возвращает:
+    - list: Список объектов BulkItem.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        first_line = f.readline()
+        f.seek(0)
+        if 'payment_id' in first_line:
+            return [BulkItem(row['payment_id'].strip(), row.get('amount') or None, row.get('currency'))
+                    for row in csv.DictReader(f) if row.get('payment_id')]
+        return [BulkItem(row[0].strip()) for row in csv.reader(f) if row and row[0].strip()]
+
+
+class BulkOperationRunner:
+    """
+    Выполняет подтверждение, отмену или возврат по списку платежей с ограниченной
+    параллельностью и сохранением прогресса в базе данных.
+
+    Ключ идемпотентности каждой операции вычисляется из идентификатора пакета, операции,
+    платежа и номера попытки, поэтому повторный запуск пакета после сбоя не создает дублей
+    в ЮKassa. Уже выполненные платежи пакета при повторном запуске пропускаются.
+
+    Номер попытки увеличивается для платежей, запрос по которым ЮKassa отклонила
+    (статус 'rejected', например, неверная сумма в файле): с прежним ключом ЮKassa вернула бы
+    ту же ошибку. После сетевых сбоев и ошибок сервера (статус 'failed') запрос повторяется
+    с прежним ключом, чтобы не выполнить операцию дважды.
+
+    ЮKassa помнит ключ идемпотентности только 24 часа (IDEMPOTENCE_KEY_TTL) с первого запроса:
+    позже прежний ключ уже не защищает от повтора. Поэтому время первого запроса с каждым ключом
+    сохраняется, и если с него прошло больше 24 часов, перед повтором платежа со статусом 'failed'
+    его состояние проверяется в ЮKassa (статус платежа или список возвратов): если операция уже
+    выполнена, платеж отмечается выполненным без запроса, иначе запрос отправляется с новым ключом.
+    """
+
+    def __init__(self, db: Database, batch_id: str, operation: str, concurrency: int = 10,
+                 checkpoint_every: int = 50, payment_processor: Optional[PaymentProcessor] = None) -> None:
+        """
+        Параметры:
+        - db (Database): База данных для контрольных точек.
+        - batch_id (str): Идентификатор пакета, по нему возобновляется выполнение.
+        - operation (str): Операция: 'capture', 'cancel' или 'refund'.
+        - concurrency (int): Максимальное число одновременных запросов к ЮKassa.
+        - checkpoint_every (int): Число результатов, после которого они сохраняются в базу.
+        - payment_processor (PaymentProcessor, optional): Платежный процессор магазина,
+          по умолчанию с реквизитами из переменных окружения.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        self.db = db
+        self.batch_id = batch_id
+        self.operation = operation
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.payment_processor = payment_processor or PaymentProcessor()
+        self._pending_rows: List[tuple] = []
+        self.attempts: Dict[str, int] = {}
+        # Время первого запроса с текущим ключом идемпотентности платежа
+        self.key_created_at: Dict[str, int] = {}
+        # Платежи, которые перед повтором нужно проверить в ЮKassa (ключ идемпотентности истек)
+        self.to_verify: set = set()
+        self.failures: List[Dict[str, str]] = []
+        self.succeeded = 0
+
+    def idempotence_key(self, payment_id: str, attempt: int = 0) -> str:
+        name = f"{self.batch_id}:{self.operation}:{payment_id}"
+        if attempt:
+            name = f"{name}:{attempt}"
+        return str(uuid.uuid5(IDEMPOTENCE_NAMESPACE, name))
+
+    async def execute(self, item: BulkItem) -> Dict[str, Any]:
+        """
+        Выполняет операцию над одним платежом.
+
+        Параметры:
+        - item (BulkItem): Платеж.
+
+        Возвращает:
+        - dict: Ответ ЮKassa.
+        """
+        if self.operation == 'refund' and item.amount is None:
+            raise ValueError("Refund requires amount")
+        key = self.idempotence_key(item.payment_id, self.attempts.get(item.payment_id, 0))
+        self.key_created_at.setdefault(item.payment_id, int(time.time()))
+        if self.operation == 'capture':
+            return await self.payment_processor.capture_payment(item.payment_id, item.amount, item.currency, key)
+        if self.operation == 'cancel':
+            return await self.payment_processor.cancel_payment(item.payment_id, key)
+        return await self.payment_processor.create_refund(item.payment_id, item.amount, item.currency, key)
+
+    async def is_applied(self, item: BulkItem) -> bool:
+        """
+        Проверяет в ЮKassa, выполнена ли уже операция над платежом.
+
+        Для подтверждения и отмены проверяется статус платежа, для возврата — наличие
+        неотмененного возврата этого платежа на ту же сумму.
+
+        Параметры:
+        - item (BulkItem): Платеж.
+
+        Возвращает:
+        - bool: True, если операция уже выполнена.
+        """
+        if self.operation == 'refund':
+            if item.amount is None:
+                raise ValueError("Refund requires amount")
+            refunds = await self.payment_processor.list_refunds({'payment_id': item.payment_id, 'limit': 100})
+            return any(refund['status'] != 'canceled' and refund['amount']['currency'] == item.currency
+                       and Decimal(refund['amount']['value']) == Decimal(item.amount)
+                       for refund in refunds.get('items', []))
+        payment = await self.payment_processor.get_payment(item.payment_id)
+        return payment.get('status') == ('succeeded' if self.operation == 'capture' else 'canceled')
+
+    def record(self, payment_id: str, status: str, error: Optional[str] = None) -> None:
+        self._pending_rows.append((self.batch_id, payment_id, self.operation, status, error, int(time.time()),
+                                   self.attempts.get(payment_id, 0), self.key_created_at.get(payment_id)))
+        if len(self._pending_rows) >= self.checkpoint_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Сохраняет накопленные результаты в базу данных одной транзакцией.
+        """
+        if self._pending_rows:
+            self.db.save_bulk_results(self._pending_rows)
+            self._pending_rows = []
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            try:
+                if item.payment_id in self.to_verify:
+                    if await self.is_applied(item):
+                        logger.info(f"Bulk {self.operation} for payment {item.payment_id} was already applied")
+                        self.succeeded += 1
+                        self.record(item.payment_id, 'done')
+                        continue
+                    # Прежний ключ истек, повторяем с новым
+                    self.to_verify.discard(item.payment_id)
+                    self.attempts[item.payment_id] += 1
+                    self.key_created_at.pop(item.payment_id, None)
+                await self.execute(item)
+                self.succeeded += 1
+                self.record(item.payment_id, 'done')
+            except Exception as e:
+                logger.error(f"Bulk {self.operation} failed for payment {item.payment_id}: {e}")
+                self.failures.append({'payment_id': item.payment_id, 'error': str(e)})
+                rejected = isinstance(e, YooKassaError) and e.is_final
+                self.record(item.payment_id, 'rejected' if rejected else 'failed', str(e))
+
+    async def run(self, items: Iterable[BulkItem]) -> Dict[str, Any]:
+        """
+        Выполняет операцию над всеми платежами, пропуская уже выполненные в этом пакете.
+
+        Параметры:
+        - items (Iterable[BulkItem]): Платежи.
+
+        Возвращает:
+        - dict: Отчет: число платежей, выполненных, пропущенных и неудачных операций,
+          длительность, пропускная способность и список ошибок.
+        """
+        progress = self.db.get_bulk_progress(self.batch_id)
+        items = list(items)
+        now = time.time()
+        seen = set()
+        todo = []
+        for item in items:
+            status, attempt, key_created_at = progress.get(item.payment_id, (None, 0, None))
+            if status == 'done' or item.payment_id in seen:
+                continue
+            # Отклоненный ЮKassa запрос повторяем с новым ключом идемпотентности
+            self.attempts[item.payment_id] = attempt + 1 if status == 'rejected' else attempt
+            if status == 'failed' and key_created_at:
+                # Повтор с прежним ключом: ЮKassa помнит его 24 часа с первого запроса
+                self.key_created_at[item.payment_id] = key_created_at
+                if now - key_created_at >= IDEMPOTENCE_KEY_TTL:
+                    self.to_verify.add(item.payment_id)
+            seen.add(item.payment_id)
+            todo.append(item)
+        logger.info(f"Bulk {self.operation} {self.batch_id}: {len(todo)} to process, "
+                    f"{len(items) - len(todo)} skipped")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in todo:
+            queue.put_nowait(item)
+        workers = min(self.concurrency, len(todo)) or 1
+        for _ in range(workers):
+            queue.put_nowait(None)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._worker(queue) for _ in range(workers)))
+        finally:
+            self.flush()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'batch_id': self.batch_id,
+            'operation': self.operation,
+            'total': len(items),
+            'skipped': len(items) - len(todo),
+            'succeeded': self.succeeded,
+            'failed': len(self.failures),
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_per_second': round(len(todo) / elapsed, 2) if elapsed > 0 else 0.0,
+            'failures': self.failures,
+        }
+        logger.info(f"Bulk {self.operation} {self.batch_id} finished: {report['succeeded']} succeeded, "
+                    f"{report['failed']} failed, {report['throughput_per_second']} ops/s")
+        return report
@@ -1,11 +1,15 @@
-import json
 import os
 import time
-import aiohttp
 from config.logger import logger
+from config.http import get_session
+from config.registry import BotConfig, tariff_from_text
+from config.tracing import tracer
 from config.types import Message
 from typing import Dict, Any, Optional, List
+from coordination import Coordinator, SQLiteCoordinator
 from db import Database
+from handler.admission import AdmissionController, ADMIT, CANNED_REPLIES
+from handler.invoices import InvoiceIndex, OpenInvoice
 from handler.payment import PaymentProcessor
 
 
@@ -14,17 +18,35 @@ class CommandHandler:
     Обработчик команд для бота.
     """
 
-    def __init__(self, bot: Any) -> None:
+    def __init__(self, bot: Any, db: Optional[Database] = None, coordinator: Optional[Coordinator] = None) -> None:
         """
         Инициализация объекта CommandHandler.
 
         Параметры:
         - bot (Any): Объект бота, к которому привязан обработчик.
+        - db (Database, optional): Локальная база данных; по умолчанию открывается database.db.
+        - coordinator (Coordinator, optional): Общее для узлов состояние (заказы, очереди проверок);
+          по умолчанию в локальной базе.
         """
         self.bot = bot
-        self.db = Database('database.db')
-        self.payment_processor: PaymentProcessor = PaymentProcessor()
-        self.base_url: str = os.getenv('BASE_URL')
+        self.config: BotConfig = bot.config if bot is not None else BotConfig.from_env()
+        self.bot_id: str = self.config.bot_id
+        self.db = db if db is not None else Database('database.db')
+        self.coordinator: Coordinator = coordinator if coordinator is not None else SQLiteCoordinator(self.db)
+        self.payment_checks_queue: str = f"payment_checks:{self.bot_id}"
+        self.payment_processor: PaymentProcessor = PaymentProcessor(self.config.account_id, self.config.secret_key,
+                                                                    self.config.return_url)
+        self.tariffs: Dict[str, int] = self.config.tariffs
+        # Лимиты запросов у каждого бота свои, корзина платежей — по тарифам этого бота
+        self.admission: AdmissionController = AdmissionController(self.tariffs)
+        # Открытые счета Telegram для быстрого ответа на pre_checkout_query
+        self.invoices: InvoiceIndex = InvoiceIndex(self.tariffs, ttl=float(os.getenv('INVOICE_TTL', '3600')))
+        self.base_url: str = self.config.base_url
+        # Задержка перед проверкой статуса платежа, в секундах
+        self.payment_check_delay: float = float(os.getenv('PAYMENT_CHECK_DELAY', '30'))
+        # Через сколько секунд повторить неудавшуюся проверку и сколько секунд после срока ее повторять
+        self.payment_check_retry: float = float(os.getenv('PAYMENT_CHECK_RETRY', '60'))
+        self.payment_check_max_age: float = float(os.getenv('PAYMENT_CHECK_MAX_AGE', '3600'))
         self.commands: Dict[str, Any] = {
             "/start": self.send_initial_menu,
             "/help": self.send_help_command,
@@ -38,20 +60,63 @@ class CommandHandler:
 
     async def handle_command(self, message: Message) -> None:
         """
-        Обработка команды из сообщения.
+        Обработка команды из сообщения: контроль доступа, затем выполнение команды.
+
+        Параметры:
+        - message (Message): Объект сообщения, содержащий информацию о чате и тексте сообщения.
+        """
+        if await self.admit(message):
+            await self.dispatch_command(message)
+
+    async def admit(self, message: Message) -> bool:
+        """
+        Контроль доступа: решение принимается сразу, без обращений к хранилищу; на отклоненный
+        запрос отправляется готовый ответ.
+
+        Параметры:
+        - message (Message): Входящее сообщение.
+
+        Возвращает:
+        - bool: True, если сообщение допущено к обработке.
+        """
+        decision: str = self.admission.admit(message)
+        if decision != ADMIT:
+            await self.send_admission_reply(message, decision)
+            return False
+        return True
+
+    async def dispatch_command(self, message: Message) -> None:
+        """
+        Выполняет команду сообщения, уже допущенного контролем доступа.
 
         Параметры:
         - message (Message): Объект сообщения, содержащий информацию о чате и тексте сообщения.
         """
         command: str = message.content
-        if command.startswith("Тариф"):
-            await self.handle_payment_selection(message)
-        else:
-            handler: Any = self.commands.get(command, self.send_unknown_command_message)
-            await handler(message)  # Всегда передаем объект message в обработчике команды
+        self.admission.in_flight += 1
+        try:
+            with tracer.span('handler'):
+                if tariff_from_text(command) in self.tariffs:
+                    await self.handle_payment_selection(message)
+                else:
+                    handler: Any = self.commands.get(command, self.send_unknown_command_message)
+                    await handler(message)  # Всегда передаем объект message в обработчике команды
+        finally:
+            self.admission.in_flight -= 1
 
-    @staticmethod
-    async def send_message(message: Message) -> bool:
+    async def send_admission_reply(self, message: Message, decision: str) -> None:
+        """
+        Отправляет готовый ответ на запрос, не допущенный к обработке.
+
+        Параметры:
+        - message (Message): Объект сообщения, не допущенного к обработке.
+        - decision (str): Решение контроля доступа.
+        """
+        response_text: Optional[str] = CANNED_REPLIES.get(decision)
+        if response_text and self.admission.should_notify(message.chat_id):
+            await self.send_message(Message(chat_id=message.chat_id, content=response_text))
+
+    async def send_message(self, message: Message) -> bool:
         """
         Отправляет сообщение через API Telegram.
 
@@ -61,27 +126,16 @@ class CommandHandler:
         Возвращает:
         - bool: True, если сообщение успешно отправлено, False в противном случае.
         """
-        try:
-            async with aiohttp.ClientSession() as session:
-                data: Dict[str, Any] = {
-                    'chat_id': message.chat_id,
-                    'text': message.content,
-                }
-                if message.reply_markup:
-                    data['reply_markup'] = json.dumps(message.reply_markup)
-                if message.parse_mode:
-                    data['parse_mode'] = message.parse_mode
-                async with session.post(os.getenv('SEND_MESSAGE'), data=data) as response:
-                    if response.status == 200:
-                        return True
-                    else:
-                        # Если не удалось отправить сообщение, записываем ошибку в логи
-                        logger.error(f"Failed to send message: {response.status}")
-                        return False
-        except Exception as e:
-            # Обрабатываем возможные ошибки при отправке сообщения
-            logger.error(f"Error occurred while sending message: {e}")
-            return False
+        data: Dict[str, Any] = {
+            'chat_id': message.chat_id,
+            'text': message.content,
+        }
+        if message.reply_markup:
+            data['reply_markup'] = message.reply_markup
+        if message.parse_mode:
+            data['parse_mode'] = message.parse_mode
+        result = await self.call_api('sendMessage', data)
+        return bool(result.get('ok'))
 
     async def send_unknown_command_message(self, message: Message) -> None:
         """
@@ -238,10 +292,9 @@ class CommandHandler:
             response_message = "Добро пожаловать! Выберите тариф для оплаты."
             reply_markup = {
                 "keyboard": [
-                    [{"text": "Тариф 1: 1000 RUB", "callback_data": "Тариф 1"}],
-                    [{"text": "Тариф 2: 2000 RUB", "callback_data": "Тариф 2"}],
-                    [{"text": "Тариф 3: 3000 RUB", "callback_data": "Тариф 3"}],
-                    [{"text": "Главное меню", "callback_data": "Тариф 3"}]
+                    [{"text": f"{tariff}: {price} RUB", "callback_data": tariff}] for tariff, price in self.tariffs.items()
+                ] + [
+                    [{"text": "Главное меню", "callback_data": "Главное меню"}]
                 ],
                 'resize_keyboard': True
             }
@@ -261,26 +314,28 @@ class CommandHandler:
         - None
         """
         try:
-            # Извлекаем выбранный тариф из сообщения
-            selected_tariff = message.content.split(":")[0].strip()
-            price = 0
+            # Извлекаем выбранный тариф из текста кнопки "{тариф}: {цена} RUB"
+            selected_tariff = tariff_from_text(message.content)
             # Определяем цену в зависимости от выбранного тарифа
-            if selected_tariff == 'Тариф 1':
-                price = 1000
-            elif selected_tariff == 'Тариф 2':
-                price = 2000
-            elif selected_tariff == 'Тариф 3':
-                price = 3000
+            price = self.tariffs.get(selected_tariff, 0)
 
-            # Создаем платеж и получаем ссылку для оплаты
-            confirmation_url, order_id = await self.payment_processor.create_payment(
-                value=str(price),
-                currency="RUB",
-                description=f"Оплата подписки на тариф '{selected_tariff}'"
-            )
+            # Оплата через счет Telegram вместо ссылки ЮKassa
+            if self.config.payment_flow == 'invoice':
+                await self.send_invoice(message, selected_tariff, price)
+                return
 
-            # Сохраняем информацию о заказе в базе данных со статусом 'pending'
-            self.db.insert_order(message.user_id, selected_tariff, 'pending')
+            # Создаем платеж и получаем ссылку для оплаты
+            with tracer.span('yookassa.create_payment'):
+                confirmation_url, payment_id = await self.payment_processor.create_payment(
+                    value=str(price),
+                    currency="RUB",
+                    description=f"Оплата подписки на тариф '{selected_tariff}'"
+                )
+
+            # Сохраняем информацию о заказе в общем хранилище со статусом 'pending'
+            with tracer.span('coordinator.insert_order'):
+                await self.coordinator.insert_order(message.user_id, selected_tariff, 'pending', payment_id,
+                                                    bot_id=self.bot_id)
 
             # Создаем кнопку оплаты с полученной ссылкой
             reply_markup: Dict[str, Any] = {
@@ -294,26 +349,54 @@ class CommandHandler:
             msg = Message(chat_id=message.chat_id, content=response_message, reply_markup=reply_markup)
             await self.send_message(msg)
 
-            # Ждем (60 секунд)
-            time.sleep(30)
-            order_status = self.payment_processor.get_payment_info(order_id)
-            print(order_status)
-
-            # Определяем сообщение в зависимости от статуса оплаты
-            if order_status.get('paid', True):
-                response_message = f'Ваш ID: {order_id}\n' \
-                                   f'Спасибо за подписку на HRbot!'
-            else:
-                response_message = "Платеж не подтвержден. Пожалуйста, проверьте статус оплаты позже."
-
-            # Отправляем сообщение пользователю
-            msg = Message(chat_id=message.chat_id, content=response_message)
-            await self.send_message(msg)
+            # Проверку статуса платежа выполнит узел-лидер, когда наступит срок
+            due_at = time.time() + self.payment_check_delay
+            await self.coordinator.push_pending_check(
+                self.payment_checks_queue,
+                {'payment_id': payment_id, 'chat_id': message.chat_id, 'due_at': due_at},
+                due_at=due_at
+            )
 
         except Exception as e:
             # Обрабатываем возможные ошибки и записываем их в логи
             logger.error(f"Error occurred while handling payment selection: {e}")
 
+    async def check_pending_payments(self) -> None:
+        """
+        Проверяет статус платежей, срок проверки которых наступил, и сообщает результат пользователю.
+        Выполняется периодически на узле-лидере.
+
+        Проверка удаляется из очереди только после того, как сообщение отправлено; если ЮKassa
+        или Telegram недоступны, она повторяется через payment_check_retry секунд, но не дольше
+        payment_check_max_age секунд после срока.
+        """
+        claimed = await self.coordinator.claim_due_checks(self.payment_checks_queue,
+                                                          visibility=self.payment_check_retry)
+        for receipt, check in claimed:
+            order_id = check['payment_id']
+            try:
+                payment = await self.payment_processor.get_payment(order_id)
+                if payment.get('status'):
+                    await self.coordinator.update_order_statuses([(payment['status'], order_id)])
+
+                # Определяем сообщение в зависимости от статуса оплаты
+                if payment.get('paid'):
+                    response_message = f'Ваш ID: {order_id}\n' \
+                                       f'Спасибо за подписку на HRbot!'
+                else:
+                    response_message = "Платеж не подтвержден. Пожалуйста, проверьте статус оплаты позже."
+
+                # Отправляем сообщение пользователю
+                msg = Message(chat_id=check['chat_id'], content=response_message)
+                if not await self.send_message(msg):
+                    raise RuntimeError("message was not sent")
+            except Exception as e:
+                if time.time() - check.get('due_at', 0) < self.payment_check_max_age:
+                    logger.error(f"Error occurred while checking payment {order_id}, will retry: {e}")
+                    continue
+                logger.error(f"Giving up on checking payment {order_id}: {e}")
+            await self.coordinator.ack_check(self.payment_checks_queue, receipt)
+
     async def handle_payment_info(self, message: Message) -> None:
         """
         Обрабатывает запрос пользователя о состоянии платежа.
@@ -326,23 +409,142 @@ class CommandHandler:
         """
         try:
             payment_id = message.content.split(":")[1].strip()  # Получаем идентификатор платежа из сообщения
-            payment_info = self.payment_processor.get_payment_info(payment_id)
+            payment_info = await self.payment_processor.get_payment_info(payment_id)
             response_message = f"Информация о платеже:\n{payment_info}"
             msg = Message(chat_id=message.chat_id, content=response_message)
             await self.send_message(msg)
         except Exception as e:
             logger.error(e)
 
-    @staticmethod
-    async def delete_message(chat_id, message_id):
+    async def load_invoice(self, payload: str) -> None:
+        """
+        Добавляет в индекс открытый счет из общего хранилища заказов, например, выставленный
+        другим узлом или до перезапуска.
+
+        Параметры:
+        - payload (str): Идентификатор счета.
+        """
+        with tracer.span('coordinator.get_order'):
+            order = await self.coordinator.get_order(payload)
+        if order is None or order['bot_id'] != self.bot_id or order['status'] not in ('invoiced', 'pre_checkout'):
+            return
+        price = self.tariffs.get(order['tariff'])
+        if price is not None:
+            self.invoices.add(OpenInvoice(payload, order['user_id'], order['tariff'], price * 100,
+                                          created_at=order['created_at'], status=order['status']))
+
+    async def call_api(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Вызывает метод API Telegram этого бота. Все обращения обработчика к Telegram идут через
+        этот метод (replay.py подменяет его заглушкой).
+
+        Параметры:
+        - method (str): Название метода, например 'sendInvoice'.
+        - data (dict): Параметры метода.
+
+        Возвращает:
+        - dict: Ответ Telegram (пустой словарь в случае ошибки).
+        """
         try:
-            async with aiohttp.ClientSession() as session:
-                response = await session.post(f'{os.getenv("DELETE_MESSAGE")}',
-                                              json={'chat_id': chat_id, 'message_id': message_id})
-                data = await response.json()
-                if data.get('ok'):
-                    logger.info('Last message deleted successfully.')
-                else:
-                    logger.error('Failed to delete last message.')
+            with tracer.span(f'telegram.{method}'):
+                async with get_session().post(self.config.api_url(method), json=data) as response:
+                    result = await response.json()
+                    if not result.get('ok'):
+                        logger.error(f"Telegram {method} failed: {result}")
+                    return result
+        except Exception as e:
+            logger.error(f"Error occurred while calling {method}: {e}")
+            return {}
+
+    async def send_invoice(self, message: Message, tariff: str, price: int) -> None:
+        """
+        Выставляет пользователю счет Telegram на оплату тарифа.
+
+        Счет сначала добавляется в индекс открытых счетов, чтобы pre_checkout_query можно было
+        проверить без обращения к хранилищу, и сохраняется в общем хранилище заказов (для других
+        узлов), затем отправляется пользователю.
+
+        Параметры:
+        - message (Message): Объект сообщения с выбором тарифа.
+        - tariff (str): Название тарифа.
+        - price (int): Цена тарифа в рублях.
+        """
+        invoice = OpenInvoice(self.invoices.new_payload(), message.user_id, tariff, price * 100)
+        self.invoices.add(invoice)
+        with tracer.span('coordinator.insert_order'):
+            await self.coordinator.insert_order(message.user_id, tariff, 'invoiced', invoice.payload,
+                                                bot_id=self.bot_id)
+        result = await self.call_api('sendInvoice', {
+            'chat_id': message.chat_id,
+            'title': f"Подписка: {tariff}",
+            'description': f"Оплата подписки на тариф '{tariff}'",
+            'payload': invoice.payload,
+            'provider_token': self.config.provider_token,
+            'currency': invoice.currency,
+            'prices': [{'label': tariff, 'amount': invoice.amount}],
+        })
+        if not result.get('ok'):
+            self.invoices.pop(invoice.payload)
+            await self.coordinator.update_order_statuses([('failed', invoice.payload)])
+
+    async def handle_pre_checkout_query(self, query: Dict[str, Any]) -> None:
+        """
+        Отвечает на pre_checkout_query: проверка по индексу открытых счетов в памяти (счета, которых
+        в нем нет, подгружаются из общего хранилища заказов), ответ отправляется сразу, статус
+        заказа сохраняется после ответа. Если хранилище недоступно, запрос все равно получает
+        ответ (отказ), иначе оплата завершится ошибкой по таймауту Telegram.
+
+        Параметры:
+        - query (dict): Объект pre_checkout_query из обновления Telegram.
+        """
+        payload = query.get('invoice_payload')
+        try:
+            if payload and self.invoices.get(payload) is None:
+                await self.load_invoice(payload)
+            ok, error_message = self.invoices.validate(payload, query['from']['id'],
+                                                       query.get('currency'), query.get('total_amount'))
         except Exception as e:
-            logger.error(f'Error occurred: {e}')
+            logger.error(f"Error occurred while validating pre-checkout {query['id']} for invoice {payload}: {e}")
+            ok, error_message = False, "Не удалось проверить счет. Пожалуйста, попробуйте еще раз позже."
+        answer: Dict[str, Any] = {'pre_checkout_query_id': query['id'], 'ok': ok}
+        if not ok:
+            answer['error_message'] = error_message
+        await self.call_api('answerPreCheckoutQuery', answer)
+
+        logger.info(f"Pre-checkout {query['id']} for invoice {payload}: {'accepted' if ok else error_message}")
+        if ok:
+            try:
+                await self.coordinator.update_order_statuses([('pre_checkout', payload)])
+            except Exception as e:
+                logger.error(f"Error occurred while saving pre-checkout status of invoice {payload}: {e}")
+
+    async def handle_successful_payment(self, message: Message, payment: Dict[str, Any]) -> None:
+        """
+        Обрабатывает successful_payment: закрывает счет и обновляет заказ.
+
+        В заказе идентификатор счета заменяется идентификатором платежа у провайдера, чтобы
+        сверка с ЮKassa находила этот заказ.
+
+        Параметры:
+        - message (Message): Объект сообщения с успешной оплатой.
+        - payment (dict): Объект successful_payment из сообщения Telegram.
+        """
+        payload = payment.get('invoice_payload')
+        invoice = self.invoices.pop(payload)
+        provider_payment_id = payment.get('provider_payment_charge_id') or payload
+        with tracer.span('coordinator.update_order_payment'):
+            await self.coordinator.update_order_payment(payload, provider_payment_id, 'succeeded')
+        tariff_text = f" на тариф '{invoice.tariff}'" if invoice else ""
+        logger.info(f"Invoice {payload} paid: {payment.get('total_amount')} {payment.get('currency')}, "
+                    f"provider payment {provider_payment_id}")
+
+        response_message = f"Ваш ID: {provider_payment_id}\n" \
+                           f"Спасибо за подписку{tariff_text}!"
+        await self.send_message(Message(chat_id=message.chat_id, content=response_message))
+
+    async def delete_message(self, chat_id, message_id):
+        data = await self.call_api('deleteMessage', {'chat_id': chat_id, 'message_id': message_id})
+        if data.get('ok'):
+            logger.info('Last message deleted successfully.')
+        else:
+            logger.error('Failed to delete last message.')
@@ -0,0 +1,105 @@
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+
+class OpenInvoice:
+    """
+    Выставленный, но еще не оплаченный счет Telegram.
+    """
+
+    __slots__ = ('payload', 'user_id', 'tariff', 'amount', 'currency', 'created_at', 'status')
+
+    def __init__(self, payload: str, user_id: int, tariff: str, amount: int, currency: str = "RUB",
+                 created_at: float = None, status: str = 'invoiced') -> None:
+        """
+        Параметры:
+        - payload (str): Идентификатор счета, передается в Telegram как invoice_payload.
+        - user_id (int): Пользователь, которому выставлен счет.
+        - tariff (str): Название тарифа.
+        - amount (int): Сумма в минимальных единицах валюты (копейках).
+        - currency (str): Валюта счета.
+        - created_at (float, optional): Время выставления счета (time.time).
+        - status (str): Статус счета: 'invoiced' или 'pre_checkout'.
+        """
+        self.payload = payload
+        self.user_id = user_id
+        self.tariff = tariff
+        self.amount = amount
+        self.currency = currency
+        self.created_at = created_at if created_at is not None else time.time()
+        self.status = status
+
+
+class InvoiceIndex:
+    """
+    Индекс открытых счетов в памяти для ответа на pre_checkout_query без обращения к хранилищу.
+
+    Telegram дает на ответ 10 секунд, поэтому проверка выполняется по этому индексу и по тарифам
+    бота. Индекс — кэш узла: счета, выставленные другими узлами, CommandHandler подгружает в него
+    из общего хранилища заказов. Счета старше ttl считаются просроченными и удаляются при
+    выставлении новых счетов.
+    """
+
+    def __init__(self, tariffs: Dict[str, int], ttl: float = 3600) -> None:
+        """
+        Параметры:
+        - tariffs (dict): Тарифы бота: название -> цена в рублях.
+        - ttl (float): Время жизни счета в секундах.
+        """
+        self.tariffs = tariffs
+        self.ttl = ttl
+        self._invoices: Dict[str, OpenInvoice] = {}
+
+    def __len__(self) -> int:
+        return len(self._invoices)
+
+    @staticmethod
+    def new_payload() -> str:
+        return uuid.uuid4().hex
+
+    def add(self, invoice: OpenInvoice) -> None:
+        self._evict_expired(time.time())
+        self._invoices[invoice.payload] = invoice
+
+    def get(self, payload: str) -> Optional[OpenInvoice]:
+        return self._invoices.get(payload)
+
+    def pop(self, payload: str) -> Optional[OpenInvoice]:
+        return self._invoices.pop(payload, None)
+
+    def _evict_expired(self, now: float) -> None:
+        # Словарь упорядочен по времени добавления, поэтому просроченные счета в начале
+        expired = []
+        for payload, invoice in self._invoices.items():
+            if now - invoice.created_at < self.ttl:
+                break
+            expired.append(payload)
+        for payload in expired:
+            del self._invoices[payload]
+
+    def validate(self, payload: str, user_id: int, currency: str, total_amount: int) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет pre_checkout_query по открытому счету.
+
+        Параметры:
+        - payload (str): invoice_payload из запроса.
+        - user_id (int): Пользователь, который оплачивает счет.
+        - currency (str): Валюта из запроса.
+        - total_amount (int): Сумма из запроса в минимальных единицах валюты.
+
+        Возвращает:
+        - tuple: (True, None), если счет можно оплатить, иначе (False, текст ошибки для пользователя).
+        """
+        invoice = self._invoices.get(payload)
+        if invoice is None or time.time() - invoice.created_at >= self.ttl:
+            return False, "Счет устарел. Пожалуйста, выберите тариф заново."
+        if invoice.user_id != user_id:
+            return False, "Этот счет выставлен другому пользователю."
+        price = self.tariffs.get(invoice.tariff)
+        if price is None:
+            return False, "Тариф больше недоступен. Пожалуйста, выберите другой тариф."
+        if currency != invoice.currency or total_amount != invoice.amount or total_amount != price * 100:
+            return False, "Сумма счета изменилась. Пожалуйста, выберите тариф заново."
+        invoice.status = 'pre_checkout'
+        return True, None
@@ -1,25 +1,87 @@
 import os
 from typing import Dict, Any, Tuple
 import uuid
+import aiohttp
 from dotenv import load_dotenv
-from yookassa import Refund, Configuration, Payment
 
+from config.http import get_session
 from config.logger import logger
+from config.registry import DEFAULT_RETURN_URL
 
 load_dotenv()
 
+API_URL = "https://api.yookassa.ru/v3"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+
+class YooKassaError(Exception):
+    """
+    Ошибка, возвращенная API ЮKassa.
+    """
+
+    def __init__(self, status: int, code: str = None, description: str = None) -> None:
+        """
+        Параметры:
+        - status (int): HTTP-статус ответа.
+        - code (str, optional): Код ошибки ЮKassa, например, "invalid_request".
+        - description (str, optional): Описание ошибки.
+        """
+        super().__init__(f"YooKassa error {status} {code}: {description}")
+        self.status = status
+        self.code = code
+        self.description = description
+
+    @property
+    def is_final(self) -> bool:
+        """
+        Ошибка в самом запросе (4xx, кроме 429): повтор с тем же ключом идемпотентности вернет ту же ошибку.
+        """
+        return 400 <= self.status < 500 and self.status != 429
+
 
 class PaymentProcessor:
-    def __init__(self):
-        # Инициализация параметров магазина из переменных окружения
-        self.shop_id = Configuration.account_id = os.getenv('ACCOUNT_ID')
-        self.secret_key = Configuration.secret_key = os.getenv('SECRET_KEY')
+    def __init__(self, shop_id: str = None, secret_key: str = None, return_url: str = None):
+        # Инициализация параметров магазина (по умолчанию из переменных окружения)
+        self.shop_id = shop_id or os.getenv('ACCOUNT_ID')
+        self.secret_key = secret_key or os.getenv('SECRET_KEY')
+        self.return_url = return_url or DEFAULT_RETURN_URL
         self.bot_token = os.getenv('BOT_TOKEN')
 
-    @staticmethod
-    async def create_payment(value: str, currency: str, description: str) -> Tuple[str, str]:
+    async def _request(self, method: str, path: str, data: Dict[str, Any] = None, params: Dict[str, Any] = None,
+                       idempotence_key: str = None) -> Dict[str, Any]:
         """
-        Создает платеж и возвращает ссылку для переадресации и уникальный идентификатор заказа.
+        Выполняет запрос к API ЮKassa через общую HTTP-сессию с реквизитами этого магазина.
+
+        Параметры:
+        - method (str): HTTP-метод.
+        - path (str): Путь метода API, например, "/payments".
+        - data (dict, optional): Тело запроса.
+        - params (dict, optional): Параметры строки запроса.
+        - idempotence_key (str, optional): Ключ идемпотентности (для POST-запросов).
+
+        Возвращает:
+        - dict: Ответ ЮKassa.
+
+        Исключения:
+        - YooKassaError: Если ЮKassa вернула ошибку.
+        """
+        headers = {}
+        if idempotence_key:
+            headers['Idempotence-Key'] = idempotence_key
+        if params:
+            params = {key: str(value) for key, value in params.items()}
+        async with get_session().request(method, f"{API_URL}{path}", json=data, params=params, headers=headers,
+                                         auth=aiohttp.BasicAuth(self.shop_id, self.secret_key),
+                                         timeout=REQUEST_TIMEOUT) as response:
+            body = await response.json(content_type=None)
+            if response.status >= 400:
+                body = body or {}
+                raise YooKassaError(response.status, body.get('code'), body.get('description'))
+            return body
+
+    async def create_payment(self, value: str, currency: str, description: str) -> Tuple[str, str]:
+        """
+        Создает платеж и возвращает ссылку для переадресации и уникальный идентификатор платежа.
 
         Параметры:
         - value (str): Сумма платежа в формате строки, например, "100.00".
@@ -27,12 +89,10 @@ class PaymentProcessor:
         - description (str): Описание платежа.
 
         Возвращает:
-        - tuple: Ссылка для переадресации и уникальный идентификатор заказа.
+        - tuple: Ссылка для переадресации и уникальный идентификатор платежа.
         """
-        Configuration.account_id = os.getenv('ACCOUNT_ID')
-        Configuration.secret_key = os.getenv('SECRET_KEY')
         idempotence_key = str(uuid.uuid4())
-        payment = Payment.create({
+        payment = await self._request('POST', '/payments', {
             "amount": {
                 "value": value,
                 "currency": currency
@@ -42,26 +102,30 @@ class PaymentProcessor:
             },
             "confirmation": {
                 "type": "redirect",
-                "return_url": "https://t.me/test_miki323_payment_bot"
+                "return_url": self.return_url
             },
             "description": description
-        }, idempotence_key)
+        }, idempotence_key=idempotence_key)
+
+        # Возвращаем URL для переадресации и идентификатор платежа, по которому заказ сверяется с ЮKassa
+        return payment['confirmation']['confirmation_url'], payment['id']
+
+    async def get_payment(self, payment_id: str) -> Dict[str, Any]:
+        """
+        Получает платеж по его уникальному идентификатору.
+
+        Параметры:
+        - payment_id (str): Уникальный идентификатор платежа.
 
-        # Получаем URL для переадресации и извлекаем идентификатор заказа из параметров URL
-        confirmation_url = payment.confirmation.confirmation_url
-        query_string = confirmation_url.split("?")[1]
-        parameters = query_string.split("&")
-        parameters_dict = {}
-        for param in parameters:
-            key, value = param.split("=")
-            parameters_dict[key] = value
-        order_id = parameters_dict.get("orderId")
+        Возвращает:
+        - dict: Платеж ЮKassa.
 
-        # Возвращаем URL и уникальный идентификатор заказа
-        return confirmation_url, order_id
+        Исключения:
+        - YooKassaError: Если ЮKassa вернула ошибку.
+        """
+        return await self._request('GET', f'/payments/{payment_id}')
 
-    @staticmethod
-    def get_payment_info(payment_id: str) -> Dict[str, Any]:
+    async def get_payment_info(self, payment_id: str) -> Dict[str, Any]:
         """
         Получает информацию о платеже по его уникальному идентификатору.
 
@@ -72,42 +136,77 @@ class PaymentProcessor:
         - dict: Информация о платеже в форме словаря.
         """
         try:
-            payment_info = Payment.find_one(payment_id).confirmation
-            return payment_info
+            return await self.get_payment(payment_id)
         except Exception as e:
             # Обрабатываем возможные ошибки при поиске платежа
             logger.error(f"Error occurred while fetching payment information: {e}")
             return {}  # Возвращаем пустой словарь в случае ошибки
 
-    @staticmethod
-    async def capture_payment(payment_id: str, amount: str = None) -> None:
+    async def list_payments(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Получает страницу списка платежей.
+
+        Параметры:
+        - params (dict): Параметры запроса (фильтры, limit, cursor).
+
+        Возвращает:
+        - dict: Ответ ЮKassa с полями items и next_cursor.
+        """
+        return await self._request('GET', '/payments', params=params)
+
+    async def list_refunds(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Получает страницу списка возвратов.
+
+        Параметры:
+        - params (dict): Параметры запроса (например, payment_id, limit, cursor).
+
+        Возвращает:
+        - dict: Ответ ЮKassa с полями items и next_cursor.
+        """
+        return await self._request('GET', '/refunds', params=params)
+
+    async def capture_payment(self, payment_id: str, amount: str = None, currency: str = "RUB",
+                              idempotence_key: str = None) -> Dict[str, Any]:
         """
         Подтверждает оплату платежа.
 
         Параметры:
         - payment_id (str): Уникальный идентификатор платежа.
         - amount (str): Сумма платежа, если она отличается от изначальной.
+        - currency (str): Валюта суммы подтверждения, например, "RUB".
+        - idempotence_key (str): Ключ идемпотентности, по умолчанию генерируется случайный.
 
         Возвращает:
-        - None
+        - dict: Информация о платеже в форме словаря.
         """
-        pass
-
-    @staticmethod
-    async def cancel_payment(payment_id: str) -> None:
+        params = {}
+        if amount is not None:
+            params = {
+                "amount": {
+                    "value": amount,
+                    "currency": currency
+                }
+            }
+        return await self._request('POST', f'/payments/{payment_id}/capture', params,
+                                   idempotence_key=idempotence_key or str(uuid.uuid4()))
+
+    async def cancel_payment(self, payment_id: str, idempotence_key: str = None) -> Dict[str, Any]:
         """
         Отменяет платеж по его уникальному идентификатору.
 
         Параметры:
         - payment_id (str): Уникальный идентификатор платежа.
+        - idempotence_key (str): Ключ идемпотентности, по умолчанию генерируется случайный.
 
         Возвращает:
-        - None
+        - dict: Информация о платеже в форме словаря.
         """
-        pass
+        return await self._request('POST', f'/payments/{payment_id}/cancel', {},
+                                   idempotence_key=idempotence_key or str(uuid.uuid4()))
 
-    @staticmethod
-    async def create_refund(payment_id: str, value: str, currency: str) -> Dict[str, Any]:
+    async def create_refund(self, payment_id: str, value: str, currency: str,
+                            idempotence_key: str = None) -> Dict[str, Any]:
         """
         Создает запрос на возврат средств для определенного платежа.
 
@@ -115,15 +214,15 @@ class PaymentProcessor:
         - payment_id (str): Уникальный идентификатор платежа.
         - value (str): Сумма возврата в формате строки, например, "100.00".
         - currency (str): Валюта возврата, например, "RUB".
+        - idempotence_key (str): Ключ идемпотентности, по умолчанию генерируется случайный.
 
         Возвращает:
         - dict: Информация о возврате в форме словаря.
         """
-        refund = Refund.create({
+        return await self._request('POST', '/refunds', {
             "amount": {
                 "value": value,
                 "currency": currency
             },
             "payment_id": payment_id
-        })
-        return refund.json()
+        }, idempotence_key=idempotence_key or str(uuid.uuid4()))
@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Optional
+
+from config.logger import logger
+from coordination import Coordinator
+from handler.payment import PaymentProcessor
+
+# Статусы платежей ЮKassa, после которых платеж больше не меняется
+FINAL_STATUSES = ('succeeded', 'canceled')
+
+CHECKPOINT_NAME = 'reconciliation.{bot_id}.created_at'
+# Контрольная точка до появления нескольких ботов; используется ботом 'default', пока не сохранена новая
+LEGACY_CHECKPOINT_NAME = 'reconciliation.created_at'
+
+
+class Reconciler:
+    """
+    Инкрементальная сверка заказов с платежами ЮKassa.
+
+    Каждый запуск постранично (по курсору) получает платежи, созданные начиная с контрольной
+    точки, сопоставляет их с заказами в общем хранилище по идентификатору платежа и одним
+    запросом на страницу исправляет расходящиеся статусы.
+
+    Контрольная точка сдвигается только до самого раннего платежа, который еще может
+    измениться (не в финальном статусе), поэтому незавершенные платежи проверяются повторно,
+    а завершенная история больше не запрашивается.
+    """
+
+    def __init__(self, coordinator: Coordinator, payment_processor: PaymentProcessor, bot_id: str = 'default',
+                 page_size: int = 100) -> None:
+        """
+        Параметры:
+        - coordinator (Coordinator): Общее хранилище заказов и контрольных точек.
+        - payment_processor (PaymentProcessor): Платежный процессор магазина, с которым выполняется сверка.
+        - bot_id (str): Идентификатор бота, у каждого бота своя контрольная точка.
+        - page_size (int): Размер страницы списка платежей (не более 100).
+        """
+        self.coordinator = coordinator
+        self.payment_processor = payment_processor
+        self.bot_id = bot_id
+        self.checkpoint_name = CHECKPOINT_NAME.format(bot_id=bot_id)
+        self.page_size = page_size
+
+    async def reconcile_page(self, payments: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+        """
+        Сопоставляет страницу платежей с заказами и исправляет расходящиеся статусы.
+
+        Параметры:
+        - payments (list): Платежи ЮKassa.
+        - report (dict): Отчет, в который добавляются найденные расхождения.
+        """
+        local = await self.coordinator.get_order_statuses([payment['id'] for payment in payments])
+        updates = []
+        for payment in payments:
+            local_status = local.get(payment['id'])
+            if local_status is None:
+                report['unknown_payments'].append(payment['id'])
+            elif local_status != payment['status']:
+                updates.append((payment['status'], payment['id']))
+                report['fixed'].append({'payment_id': payment['id'], 'from': local_status, 'to': payment['status']})
+        if updates:
+            await self.coordinator.update_order_statuses(updates)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Выполняет одну инкрементальную сверку.
+
+        Возвращает:
+        - dict: Отчет: число проверенных платежей, исправленные заказы, платежи без заказа
+          и новая контрольная точка.
+        """
+        since: Optional[str] = await self.coordinator.get(self.checkpoint_name)
+        if since is None and self.bot_id == 'default':
+            since = await self.coordinator.get(LEGACY_CHECKPOINT_NAME)
+        report: Dict[str, Any] = {'checked': 0, 'fixed': [], 'unknown_payments': [], 'checkpoint': since}
+        params: Dict[str, Any] = {'limit': self.page_size}
+        if since:
+            params['created_at.gte'] = since
+
+        # Самый ранний незавершенный и самый поздний просмотренный платежи для новой контрольной точки
+        earliest_open: Optional[str] = None
+        latest_seen: Optional[str] = since
+        while True:
+            page = await self.payment_processor.list_payments(params)
+            payments = page.get('items') or []
+            report['checked'] += len(payments)
+            await self.reconcile_page(payments, report)
+            for payment in payments:
+                created_at = payment['created_at']
+                if payment['status'] not in FINAL_STATUSES and (earliest_open is None or created_at < earliest_open):
+                    earliest_open = created_at
+                if latest_seen is None or created_at > latest_seen:
+                    latest_seen = created_at
+            if not page.get('next_cursor'):
+                break
+            params['cursor'] = page['next_cursor']
+
+        checkpoint = earliest_open or latest_seen
+        if checkpoint and checkpoint != since:
+            await self.coordinator.set(self.checkpoint_name, checkpoint)
+        report['checkpoint'] = checkpoint
+
+        if report['fixed'] or report['unknown_payments']:
+            logger.warning(f"Reconciliation: checked {report['checked']}, fixed {len(report['fixed'])} orders, "
+                           f"{len(report['unknown_payments'])} payments without order: "
+                           f"{report['unknown_payments'][:20]}")
+        else:
+            logger.info(f"Reconciliation: checked {report['checked']}, no discrepancies")
+        return report
+
@@ -1,25 +1,55 @@
 import asyncio
+import os
 from aiohttp import web
+from config.http import close_session
 from config.logger import logger
+from config.registry import load_bot_configs
+from config.scheduler import Scheduler
+from config.tracing import monitor_loop_lag
+from bot.host import BotHost
 from bot.hrbot import HrBot
-from config.types import Message
+from coordination import LeaderElector, create_coordinator
+from db import Database
 
 
 async def run_bot():
-    message = Message()
-    bot = HrBot(message)
+    # Общие для всех ботов база данных, координатор узлов и планировщик фоновых задач
+    db = Database('database.db')
+    coordinator = create_coordinator(db)
+    leader = LeaderElector(coordinator)
+    scheduler = Scheduler(leader=leader)
+    scheduler.spawn('leader_election', leader.run())
+    host = BotHost(load_bot_configs(), db, scheduler, coordinator)
     app = web.Application()
-    app.router.add_post('/webhook', bot.handle_webhook)  # Устанавливаем обработчик POST запросов на /webhook
+    host.setup_routes(app)  # Вебхуки ботов на /webhook/{bot_id}
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, 'localhost', 3000)
+    site = web.TCPSite(runner, os.getenv('HOST', 'localhost'), int(os.getenv('PORT', '3000')))
     await site.start()
 
-    logger.info("Webhook started. Listening for updates...")
-    await bot.start_webhook()
+    # Мониторинг задержки цикла событий
+    if os.getenv('LOOP_LAG_MONITOR', '0') == '1':
+        scheduler.spawn('loop_lag', monitor_loop_lag())
+
+    # Проверки платежей и сверка заказов с платежами ЮKassa (на узле-лидере)
+    host.schedule_jobs()
+
+    logger.info(f"Webhook started on node {coordinator.node_id} for bots {', '.join(host.bots)}. "
+                f"Listening for updates...")
+    # За балансировщиком узлы получают общий публичный адрес, иначе поднимаем туннель ngrok
+    public_url = os.getenv('PUBLIC_URL') or HrBot.start_tunnel(os.getenv('PORT', '3000'))
+    await host.set_webhooks(public_url)
     # Бесконечный цикл для продолжения работы сервера
-    await asyncio.Event().wait()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await runner.cleanup()
+        await close_session()
+        await coordinator.close()
+        host.close()
+        db.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+from config.logger import logger
+from config.types import Message
+from bot.recorder import read_segments
+from db import Database
+from handler.admission import AdmissionController, ADMIT
+from handler.handlers import CommandHandler
+
+
+class StubTelegram:
+    """
+    Заглушка API Telegram (CommandHandler.call_api): ничего не отправляет, считает вызовы методов
+    и имитирует задержку ответа.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Dict[str, int] = collections.Counter()
+
+    async def call_api(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        return {'ok': True, 'result': True}
+
+
+class StubPaymentProcessor:
+    """
+    Заглушка ЮKassa: создает фиктивные платежи и имитирует задержку ответа.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.created = 0
+
+    async def create_payment(self, value: str, currency: str, description: str) -> Tuple[str, str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.created += 1
+        payment_id = str(uuid.uuid4())
+        return f"https://yoomoney.ru/checkout/payments/v2/contract?orderId={payment_id}", payment_id
+
+    async def get_payment(self, payment_id: str) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return {'id': payment_id, 'status': 'succeeded', 'paid': True}
+
+    async def get_payment_info(self, payment_id: str) -> Dict[str, Any]:
+        return await self.get_payment(payment_id)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Прогоняет записанные обновления через CommandHandler с заглушками Telegram и ЮKassa.
+
+    Обновления отправляются на обработку в темпе записи, ускоренном в args.speed раз
+    (0 — без пауз, с максимальной скоростью), каждое обрабатывается отдельной задачей,
+    как при работе через вебхук. Контроль доступа работает по времени записи, поэтому
+    ускорение не добавляет отказов по лимитам; с args.no_admission он отключается.
+
+    Возвращает:
+    - dict: Отчет: число обновлений, длительность, пропускная способность и
+      распределение задержек обработки.
+    """
+    handler = CommandHandler(bot=None, db=Database(':memory:'))
+    handler.payment_check_delay = args.payment_check_delay
+    telegram = StubTelegram(args.telegram_latency)
+    payments = StubPaymentProcessor(args.yookassa_latency)
+    handler.call_api = telegram.call_api
+    handler.payment_processor = payments
+
+    # Время записи обрабатываемого обновления для контроля доступа
+    recorded_now = [0.0]
+    if args.no_admission:
+        handler.admission.admit = lambda message: ADMIT
+    else:
+        handler.admission = AdmissionController(handler.tariffs, clock=lambda: recorded_now[0])
+
+    latencies: List[float] = []
+
+    async def process(message: Message, ts: float) -> None:
+        dispatched = time.perf_counter()
+        try:
+            # Решение о допуске принимается в начале handle_command, до первого ожидания
+            recorded_now[0] = ts
+            await handler.handle_command(message)
+        except Exception as e:
+            logger.error(f"Error occurred while replaying update: {e}")
+        latencies.append(time.perf_counter() - dispatched)
+
+    tasks = []
+    first_ts = None
+    started = time.perf_counter()
+    for record in read_segments(args.paths):
+        message = Message.from_update(record['update'])
+        if message is None:
+            continue
+        if args.speed > 0:
+            if first_ts is None:
+                first_ts = record['ts']
+            delay = started + (record['ts'] - first_ts) / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(process(message, record['ts'])))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    # Отложенные проверки платежей выполняются так же, как их выполняет планировщик на узле-лидере
+    await asyncio.sleep(args.payment_check_delay)
+    await handler.check_pending_payments()
+
+    latencies.sort()
+    return {
+        'updates': len(tasks),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(tasks) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5) * 1000, 2),
+            'p90': round(percentile(latencies, 0.9) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        'messages_sent': telegram.calls['sendMessage'],
+        'invoices_sent': telegram.calls['sendInvoice'],
+        'payments_created': payments.created,
+        'admission': dict(handler.admission.stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений Telegram")
+    parser.add_argument('paths', nargs='+', help="Сегменты или папки с сегментами")
+    parser.add_argument('--speed', type=float, default=1.0, help="Ускорение времени (1 — как в записи, 0 — максимум)")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="Задержка заглушки Telegram, с")
+    parser.add_argument('--yookassa-latency', type=float, default=0.0, help="Задержка заглушки ЮKassa, с")
+    parser.add_argument('--payment-check-delay', type=float, default=0.0,
+                        help="Задержка перед проверкой статуса платежа, с")
+    parser.add_argument('--no-admission', action='store_true',
+                        help="Отключить контроль доступа и измерять только обработку")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(replay(args))
+    except KeyboardInterrupt:
+        logger.info("Replay stopped.")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
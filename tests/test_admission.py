@@ -0,0 +1,112 @@
+from config.types import Message
+from handler.admission import AdmissionController, TokenBuckets, ADMIT, COALESCED, SHED, THROTTLED
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_controller(monkeypatch, **env):
+    defaults = {'THROTTLE_USER_RATE': '1', 'THROTTLE_USER_BURST': '5', 'THROTTLE_PAYMENT_RATE': '0.1',
+                'THROTTLE_PAYMENT_BURST': '2', 'COALESCE_WINDOW': '2', 'SHED_QUEUE_THRESHOLD': '100'}
+    defaults.update(env)
+    for name, value in defaults.items():
+        monkeypatch.setenv(name, value)
+    clock = FakeClock()
+    return AdmissionController(clock=clock), clock
+
+
+def message(user_id: int, content: str) -> Message:
+    return Message(chat_id=user_id, user_id=user_id, content=content)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    buckets = TokenBuckets(rate=1, burst=3, max_keys=10)
+    assert [buckets.consume(('u',), now=0) for _ in range(4)] == [True, True, True, False]
+    assert not buckets.consume(('u',), now=0.5)
+    assert buckets.consume(('u',), now=1.5)
+
+
+def test_token_bucket_refill_is_capped_at_burst():
+    buckets = TokenBuckets(rate=10, burst=2, max_keys=10)
+    buckets.consume(('u',), now=0)
+    assert [buckets.consume(('u',), now=100) for _ in range(3)] == [True, True, False]
+
+
+def test_token_bucket_evicts_least_recently_used():
+    buckets = TokenBuckets(rate=0, burst=1, max_keys=2)
+    assert buckets.consume(('a',), now=0)
+    assert buckets.consume(('b',), now=0)
+    assert not buckets.consume(('a',), now=1)  # 'a' становится самым свежим
+    assert buckets.consume(('c',), now=2)  # вытесняет 'b'
+    assert len(buckets) == 2
+    assert buckets.consume(('b',), now=3)  # 'b' начинает с полной корзины
+
+
+def test_admit_coalesces_duplicates_within_window(monkeypatch):
+    admission, clock = make_controller(monkeypatch)
+    assert admission.admit(message(1, '/start')) == ADMIT
+    clock.now = 1
+    assert admission.admit(message(1, '/start')) == COALESCED
+    assert admission.admit(message(2, '/start')) == ADMIT
+    clock.now = 3
+    assert admission.admit(message(1, '/start')) == ADMIT
+    assert admission.stats[COALESCED] == 1
+
+
+def test_admit_throttles_user(monkeypatch):
+    admission, clock = make_controller(monkeypatch, THROTTLE_USER_BURST='2', COALESCE_WINDOW='0')
+    decisions = [admission.admit(message(1, f'/cmd{i}')) for i in range(3)]
+    assert decisions == [ADMIT, ADMIT, THROTTLED]
+    clock.now = 1
+    assert admission.admit(message(1, '/cmd')) == ADMIT
+
+
+def test_admit_throttles_payments_separately(monkeypatch):
+    admission, clock = make_controller(monkeypatch, COALESCE_WINDOW='0')
+    decisions = []
+    for i in range(3):
+        clock.now = i * 2
+        decisions.append(admission.admit(message(1, f'Тариф {i + 1}: {(i + 1) * 1000} RUB')))
+    assert decisions == [ADMIT, ADMIT, THROTTLED]
+    assert admission.admit(message(1, '/start')) == ADMIT
+
+
+def test_admit_sheds_non_critical_commands_under_load(monkeypatch):
+    admission, _ = make_controller(monkeypatch, SHED_QUEUE_THRESHOLD='1')
+    admission.in_flight = 1
+    assert admission.admit(message(1, 'История платежей')) == SHED
+    assert admission.admit(message(2, '/start')) == ADMIT
+    assert admission.admit(message(3, 'Тариф 1: 1000 RUB')) == ADMIT
+
+
+def test_admit_uses_tenant_tariff_names(monkeypatch):
+    for name, value in {'THROTTLE_PAYMENT_RATE': '0.1', 'THROTTLE_PAYMENT_BURST': '1', 'COALESCE_WINDOW': '0',
+                        'SHED_QUEUE_THRESHOLD': '1'}.items():
+        monkeypatch.setenv(name, value)
+    admission = AdmissionController(['Premium'], clock=FakeClock())
+    assert admission.admit(message(1, 'Premium: 500 RUB')) == ADMIT
+    assert admission.admit(message(1, 'Premium: 500 RUB')) == THROTTLED
+    admission.in_flight = 1
+    assert admission.admit(message(2, 'Premium: 500 RUB')) == ADMIT
+    assert admission.admit(message(3, 'Тариф 1: 1000 RUB')) == SHED
+
+
+def test_should_notify_once_per_window(monkeypatch):
+    admission, clock = make_controller(monkeypatch)
+    assert admission.should_notify(1)
+    assert not admission.should_notify(1)
+    clock.now = 2
+    assert admission.should_notify(1)
+
+
+def test_forgotten_message_is_not_coalesced(monkeypatch):
+    admission, _ = make_controller(monkeypatch)
+    assert admission.admit(message(1, '/start')) == ADMIT
+    admission.forget(message(1, '/start'))
+    assert admission.admit(message(1, '/start')) == ADMIT
+    assert admission.admit(message(1, '/start')) == COALESCED
@@ -0,0 +1,171 @@
+import asyncio
+
+from db import Database
+from handler.bulk import IDEMPOTENCE_KEY_TTL, BulkItem, BulkOperationRunner, read_items
+from handler.payment import YooKassaError
+
+
+class FakePaymentProcessor:
+    """
+    Записывает запросы (операция, платеж, ключ идемпотентности); ошибки задаются по платежу.
+    """
+
+    def __init__(self, errors: dict = None, payments: dict = None, refunds: dict = None) -> None:
+        self.errors = dict(errors or {})
+        self.payments = payments or {}
+        self.refunds = refunds or {}
+        self.requests = []
+
+    async def _call(self, operation: str, payment_id: str, key: str) -> dict:
+        self.requests.append((operation, payment_id, key))
+        error = self.errors.pop(payment_id, None)
+        if error is not None:
+            raise error
+        return {'id': payment_id}
+
+    async def get_payment(self, payment_id):
+        error = self.errors.pop(('get', payment_id), None)
+        if error is not None:
+            raise error
+        return self.payments[payment_id]
+
+    async def list_refunds(self, params):
+        return {'items': self.refunds.get(params['payment_id'], [])}
+
+    async def capture_payment(self, payment_id, amount=None, currency="RUB", idempotence_key=None):
+        return await self._call('capture', payment_id, idempotence_key)
+
+    async def cancel_payment(self, payment_id, idempotence_key=None):
+        return await self._call('cancel', payment_id, idempotence_key)
+
+    async def create_refund(self, payment_id, value, currency, idempotence_key=None):
+        return await self._call('refund', payment_id, idempotence_key)
+
+
+def run(db: Database, processor: FakePaymentProcessor, items, operation: str = 'capture') -> dict:
+    runner = BulkOperationRunner(db, 'batch-1', operation, concurrency=2, payment_processor=processor)
+    return asyncio.run(runner.run(items))
+
+
+def keys(processor: FakePaymentProcessor) -> dict:
+    return {payment_id: key for _, payment_id, key in processor.requests}
+
+
+def test_read_items_with_header_and_bom(tmp_path):
+    path = tmp_path / 'items.csv'
+    path.write_bytes('\ufeffpayment_id,amount,currency\np1,100.00,\np2,5.00,USD\n'.encode('utf-8'))
+    items = read_items(str(path))
+    assert [(item.payment_id, item.amount, item.currency) for item in items] == \
+        [('p1', '100.00', 'RUB'), ('p2', '5.00', 'USD')]
+
+
+def test_read_items_without_header(tmp_path):
+    path = tmp_path / 'items.csv'
+    path.write_text('p1\n\np2\n', encoding='utf-8')
+    assert [item.payment_id for item in read_items(str(path))] == ['p1', 'p2']
+
+
+def test_idempotence_key_is_deterministic_per_batch_operation_payment_and_attempt():
+    db = Database(':memory:')
+    runner = BulkOperationRunner(db, 'batch-1', 'capture', payment_processor=FakePaymentProcessor())
+    key = runner.idempotence_key('p1')
+    assert key == runner.idempotence_key('p1', 0)
+    assert key == BulkOperationRunner(db, 'batch-1', 'capture', payment_processor=FakePaymentProcessor()) \
+        .idempotence_key('p1')
+    assert len({key, runner.idempotence_key('p2'), runner.idempotence_key('p1', 1),
+                BulkOperationRunner(db, 'batch-2', 'capture', payment_processor=FakePaymentProcessor())
+               .idempotence_key('p1'),
+                BulkOperationRunner(db, 'batch-1', 'cancel', payment_processor=FakePaymentProcessor())
+               .idempotence_key('p1')}) == 5
+
+
+def test_resume_skips_done_and_duplicate_items():
+    db = Database(':memory:')
+    first = FakePaymentProcessor()
+    report = run(db, first, [BulkItem('p1'), BulkItem('p2'), BulkItem('p1')])
+    assert (report['succeeded'], report['skipped']) == (2, 1)
+    assert sorted(payment_id for _, payment_id, _ in first.requests) == ['p1', 'p2']
+
+    second = FakePaymentProcessor()
+    report = run(db, second, [BulkItem('p1'), BulkItem('p2'), BulkItem('p3')])
+    assert (report['succeeded'], report['skipped']) == (1, 2)
+    assert [payment_id for _, payment_id, _ in second.requests] == ['p3']
+
+
+def test_failed_item_is_retried_with_the_same_key():
+    db = Database(':memory:')
+    first = FakePaymentProcessor({'p1': YooKassaError(500, 'internal_server_error')})
+    report = run(db, first, [BulkItem('p1')])
+    assert report['failed'] == 1
+
+    second = FakePaymentProcessor()
+    report = run(db, second, [BulkItem('p1')])
+    assert report['succeeded'] == 1
+    assert keys(second)['p1'] == keys(first)['p1']
+
+
+def test_rejected_item_is_retried_with_a_new_key():
+    db = Database(':memory:')
+    first = FakePaymentProcessor({'p1': YooKassaError(400, 'invalid_request', 'amount is too big')})
+    run(db, first, [BulkItem('p1')])
+    second = FakePaymentProcessor({'p1': YooKassaError(400, 'invalid_request', 'amount is too big')})
+    run(db, second, [BulkItem('p1')])
+    third = FakePaymentProcessor()
+    report = run(db, third, [BulkItem('p1')])
+    assert report['succeeded'] == 1
+    assert len({keys(first)['p1'], keys(second)['p1'], keys(third)['p1']}) == 3
+
+
+def test_refund_without_amount_fails_without_request():
+    db = Database(':memory:')
+    processor = FakePaymentProcessor()
+    report = run(db, processor, [BulkItem('p1')], operation='refund')
+    assert report['failed'] == 1 and processor.requests == []
+
+
+def expire_keys(db: Database) -> None:
+    db.cur.execute('UPDATE bulk_operations SET key_created_at = key_created_at - ?', (IDEMPOTENCE_KEY_TTL + 1,))
+    db.conn.commit()
+
+
+def test_failed_item_with_expired_key_is_not_repeated_if_applied():
+    db = Database(':memory:')
+    first = FakePaymentProcessor({'p1': TimeoutError(), 'p2': TimeoutError()})
+    run(db, first, [BulkItem('p1'), BulkItem('p2')])
+    expire_keys(db)
+
+    second = FakePaymentProcessor(payments={'p1': {'status': 'succeeded'}, 'p2': {'status': 'waiting_for_capture'}})
+    report = run(db, second, [BulkItem('p1'), BulkItem('p2')])
+    assert report['succeeded'] == 2
+    assert [payment_id for _, payment_id, _ in second.requests] == ['p2']
+    assert keys(second)['p2'] != keys(first)['p2']
+    assert db.get_bulk_progress('batch-1')['p1'][0] == 'done'
+
+
+def test_refund_with_expired_key_checks_existing_refunds():
+    db = Database(':memory:')
+    items = [BulkItem('p1', '100.00'), BulkItem('p2', '100.00')]
+    run(db, FakePaymentProcessor({'p1': TimeoutError(), 'p2': TimeoutError()}), items, operation='refund')
+    expire_keys(db)
+
+    refund = {'status': 'succeeded', 'amount': {'value': '100.0', 'currency': 'RUB'}}
+    canceled = {'status': 'canceled', 'amount': {'value': '100.00', 'currency': 'RUB'}}
+    second = FakePaymentProcessor(refunds={'p1': [refund], 'p2': [canceled]})
+    report = run(db, second, items, operation='refund')
+    assert report['succeeded'] == 2
+    assert [payment_id for _, payment_id, _ in second.requests] == ['p2']
+
+
+def test_failed_check_keeps_the_expired_key_time():
+    db = Database(':memory:')
+    run(db, FakePaymentProcessor({'p1': TimeoutError()}), [BulkItem('p1')])
+    expire_keys(db)
+
+    second = FakePaymentProcessor({('get', 'p1'): TimeoutError()})
+    assert run(db, second, [BulkItem('p1')])['failed'] == 1
+    assert second.requests == []
+
+    # Ключ по-прежнему считается истекшим: без проверки запрос не отправляется
+    third = FakePaymentProcessor(payments={'p1': {'status': 'succeeded'}})
+    assert run(db, third, [BulkItem('p1')])['succeeded'] == 1
+    assert third.requests == []
@@ -0,0 +1,240 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from coordination import ChatLockTimeout, KeyValueCoordinator, LeaderElector, LocalStore, RedisStore, SQLiteCoordinator
+from db import Database
+
+
+def sqlite_nodes():
+    db = Database(':memory:')
+    return SQLiteCoordinator(db, node_id='a'), SQLiteCoordinator(db, node_id='b')
+
+
+def key_value_nodes():
+    store = LocalStore()
+    return KeyValueCoordinator(store, node_id='a'), KeyValueCoordinator(store, node_id='b')
+
+
+def redis_nodes():
+    # RedisStore со скриптами Lua на fakeredis (нужны пакеты redis и fakeredis[lua])
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return fakeredis.aioredis.FakeRedis(server=server, **kwargs)
+
+    with mock.patch('redis.asyncio.from_url', from_url):
+        return (KeyValueCoordinator(RedisStore('redis://fake'), node_id='a'),
+                KeyValueCoordinator(RedisStore('redis://fake'), node_id='b'))
+
+
+@pytest.fixture(params=[sqlite_nodes, key_value_nodes, redis_nodes], ids=['sqlite', 'key_value', 'redis'])
+def nodes(request):
+    """
+    Два узла с общим хранилищем.
+    """
+    return request.param()
+
+
+def test_lease_is_exclusive_and_renewable(nodes):
+    a, b = nodes
+
+    async def scenario():
+        assert await a.acquire_lease('leader', ttl=10)
+        assert not await b.acquire_lease('leader', ttl=10)
+        assert await a.acquire_lease('leader', ttl=10)  # продление своей аренды
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_is_taken_over(nodes):
+    a, b = nodes
+
+    async def scenario():
+        assert await a.acquire_lease('leader', ttl=0.1)
+        await asyncio.sleep(0.15)
+        assert await b.acquire_lease('leader', ttl=10)
+        assert not await a.acquire_lease('leader', ttl=10)
+
+    asyncio.run(scenario())
+
+
+def test_released_lease_is_free(nodes):
+    a, b = nodes
+
+    async def scenario():
+        assert await a.acquire_lease('leader', ttl=10)
+        await b.release_lease('leader')  # чужую аренду освободить нельзя
+        assert not await b.acquire_lease('leader', ttl=10)
+        await a.release_lease('leader')
+        assert await b.acquire_lease('leader', ttl=10)
+
+    asyncio.run(scenario())
+
+
+def test_leader_election_fails_over(nodes):
+    a, b = nodes
+
+    async def scenario():
+        electors = [LeaderElector(a, ttl=0.3), LeaderElector(b, ttl=0.3)]
+        tasks = [asyncio.create_task(elector.run()) for elector in electors]
+        await asyncio.sleep(0.05)
+        assert sorted(elector.is_leader for elector in electors) == [False, True]
+
+        leader = 0 if electors[0].is_leader else 1
+        tasks[leader].cancel()
+        await asyncio.gather(tasks[leader], return_exceptions=True)
+        await asyncio.sleep(0.15)
+        assert electors[1 - leader].is_leader
+
+        tasks[1 - leader].cancel()
+        await asyncio.gather(tasks[1 - leader], return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_chat_lock_is_mutually_exclusive_across_nodes(nodes):
+    a, b = nodes
+    events = []
+
+    async def handle(coordinator, name):
+        async with coordinator.chat_lock('bot:1', ttl=5, timeout=5):
+            events.append(('in', name))
+            await asyncio.sleep(0.02)
+            events.append(('out', name))
+
+    async def scenario():
+        await asyncio.gather(handle(a, 1), handle(b, 2), handle(a, 3), handle(b, 4))
+
+    asyncio.run(scenario())
+    assert len(events) == 8
+    for i in range(0, len(events), 2):
+        assert events[i][0] == 'in' and events[i + 1] == ('out', events[i][1])
+
+
+def test_chat_lock_times_out_while_held(nodes):
+    a, b = nodes
+
+    async def scenario():
+        async with a.chat_lock('bot:1', ttl=5):
+            with pytest.raises(ChatLockTimeout):
+                async with b.chat_lock('bot:1', ttl=5, timeout=0.1):
+                    pass
+        async with b.chat_lock('bot:1', ttl=5, timeout=0.1):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_chat_lock_times_out_waiting_for_local_lock(nodes):
+    a, _ = nodes
+
+    async def scenario():
+        async with a.chat_lock('bot:1', ttl=5):
+            with pytest.raises(ChatLockTimeout):
+                async with a.chat_lock('bot:1', ttl=5, timeout=0.1):
+                    pass
+        async with a.chat_lock('bot:1', ttl=5, timeout=0.1):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_chat_lock_lease_is_renewed_while_held(nodes):
+    a, b = nodes
+
+    async def scenario():
+        async with a.chat_lock('bot:1', ttl=0.15):
+            await asyncio.sleep(0.4)  # дольше срока аренды
+            assert not await b.acquire_lease('chat:bot:1', ttl=1)
+
+    asyncio.run(scenario())
+
+
+def test_pending_checks_are_claimed_once_and_retried_until_acked(nodes):
+    a, b = nodes
+
+    async def scenario():
+        await a.push_pending_check('checks', {'payment_id': 'due'}, due_at=time.time() - 1)
+        await a.push_pending_check('checks', {'payment_id': 'later'}, due_at=time.time() + 60)
+
+        claimed = await a.claim_due_checks('checks', visibility=0.1)
+        assert [item for _, item in claimed] == [{'payment_id': 'due'}]
+        assert await b.claim_due_checks('checks', visibility=0.1) == []
+
+        # Проверка не подтверждена: после visibility ее забирает другой узел
+        await asyncio.sleep(0.15)
+        claimed = await b.claim_due_checks('checks', visibility=0.1)
+        assert [item for _, item in claimed] == [{'payment_id': 'due'}]
+        await b.ack_check('checks', claimed[0][0])
+
+        await asyncio.sleep(0.15)
+        assert await a.claim_due_checks('checks', visibility=0.1) == []
+
+    asyncio.run(scenario())
+
+
+def test_orders_are_shared_between_nodes(nodes):
+    a, b = nodes
+
+    async def scenario():
+        await a.insert_order(7, 'Тариф 1', 'invoiced', 'inv-1', bot_id='brand1')
+        order = await b.get_order('inv-1')
+        assert (order['user_id'], order['tariff'], order['status'], order['bot_id']) == \
+            (7, 'Тариф 1', 'invoiced', 'brand1')
+
+        await b.update_order_statuses([('pre_checkout', 'inv-1')])
+        assert [row[0] for row in await a.get_orders_by_status('brand1', 'pre_checkout', 0)] == ['inv-1']
+        assert await a.get_orders_by_status('brand1', 'invoiced', 0) == []
+
+        await a.update_order_payment('inv-1', 'pay-1', 'succeeded')
+        assert await b.get_order('inv-1') is None
+        assert await b.get_order_statuses(['pay-1', 'missing']) == {'pay-1': 'succeeded'}
+        assert await b.get_orders_by_status('brand1', 'pre_checkout', 0) == []
+        assert await b.get_orders_by_status('default', 'succeeded', 0) == []
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_order_updates_are_not_lost(nodes):
+    a, b = nodes
+    if isinstance(b, SQLiteCoordinator):
+        pytest.skip("SQLite updates are single statements")
+
+    async def scenario():
+        await a.insert_order(7, 'Тариф 1', 'pre_checkout', 'inv-1', bot_id='brand1')
+        await a.insert_order(8, 'Тариф 1', 'pending', 'pay-2', bot_id='brand1')
+        mget = b.store.mget
+        raced = []
+
+        async def racing_mget(keys):
+            # Между чтением и записью сверки другой узел заменяет идентификатор счета
+            values = await mget(keys)
+            if not raced:
+                raced.append(True)
+                await a.update_order_payment('inv-1', 'pay-1', 'succeeded')
+            return values
+
+        b.store.mget = racing_mget
+        await b.update_order_statuses([('canceled', 'inv-1'), ('succeeded', 'pay-2')])
+        assert await a.get_order('inv-1') is None
+        assert (await a.get_order('pay-1'))['status'] == 'succeeded'
+        assert [row[0] for row in await a.get_orders_by_status('brand1', 'succeeded', 0)] == ['pay-1', 'pay-2']
+        assert await a.get_orders_by_status('brand1', 'canceled', 0) == []
+
+    asyncio.run(scenario())
+
+
+def test_values_are_shared_between_nodes(nodes):
+    a, b = nodes
+
+    async def scenario():
+        assert await b.get('offset:default') is None
+        await a.set('offset:default', '42')
+        assert await b.get('offset:default') == '42'
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+
+from config.registry import BotConfig
+from config.types import Message
+from db import Database
+from handler.handlers import CommandHandler
+
+
+class FakeBot:
+    def __init__(self, config: BotConfig) -> None:
+        self.config = config
+
+
+def make_handler(tariffs: dict) -> CommandHandler:
+    handler = CommandHandler(bot=FakeBot(BotConfig('brand1', token='token', tariffs=tariffs)), db=Database(':memory:'))
+    handler.selected = []
+    handler.sent = []
+
+    async def handle_payment_selection(message: Message) -> None:
+        handler.selected.append(message.content)
+
+    async def send_message(message: Message) -> bool:
+        handler.sent.append(message.content)
+        return True
+
+    handler.handle_payment_selection = handle_payment_selection
+    handler.send_message = send_message
+    return handler
+
+
+def test_tariff_buttons_are_routed_by_tenant_tariff_names():
+    handler = make_handler({'Premium': 500})
+    asyncio.run(handler.handle_command(Message(chat_id=1, user_id=1, content='Premium: 500 RUB')))
+    asyncio.run(handler.handle_command(Message(chat_id=2, user_id=2, content='Тариф 1: 1000 RUB')))
+    assert handler.selected == ['Premium: 500 RUB']
+    assert len(handler.sent) == 1 and 'не могу понять' in handler.sent[0]
+
+
+def pre_checkout_query(payload: str) -> dict:
+    return {'id': 'q1', 'from': {'id': 7}, 'currency': 'RUB', 'total_amount': 50000, 'invoice_payload': payload}
+
+
+def record_api_calls(handler: CommandHandler) -> list:
+    calls = []
+
+    async def call_api(method: str, data: dict) -> dict:
+        calls.append((method, data))
+        return {'ok': True}
+
+    handler.call_api = call_api
+    return calls
+
+
+def test_pre_checkout_query_loads_invoice_from_shared_store():
+    handler = make_handler({'Premium': 500})
+    asyncio.run(handler.coordinator.insert_order(7, 'Premium', 'invoiced', 'inv-1', bot_id='brand1'))
+    calls = record_api_calls(handler)
+    asyncio.run(handler.handle_pre_checkout_query(pre_checkout_query('inv-1')))
+    assert calls == [('answerPreCheckoutQuery', {'pre_checkout_query_id': 'q1', 'ok': True})]
+    assert asyncio.run(handler.coordinator.get_order('inv-1'))['status'] == 'pre_checkout'
+
+
+def test_pre_checkout_query_is_answered_when_store_fails():
+    handler = make_handler({'Premium': 500})
+    calls = record_api_calls(handler)
+
+    async def get_order(payment_id: str):
+        raise ConnectionError('store is down')
+
+    handler.coordinator.get_order = get_order
+    asyncio.run(handler.handle_pre_checkout_query(pre_checkout_query('inv-1')))
+    assert len(calls) == 1
+    method, answer = calls[0]
+    assert method == 'answerPreCheckoutQuery' and answer['ok'] is False and answer['error_message']
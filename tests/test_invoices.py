@@ -0,0 +1,62 @@
+import time
+
+from handler.invoices import InvoiceIndex, OpenInvoice
+
+TARIFFS = {'Тариф 1': 1000, 'Тариф 2': 2000}
+
+
+def make_index(ttl: float = 3600) -> InvoiceIndex:
+    index = InvoiceIndex(dict(TARIFFS), ttl=ttl)
+    index.add(OpenInvoice('p1', user_id=7, tariff='Тариф 1', amount=100000))
+    return index
+
+
+def test_validate_accepts_matching_invoice():
+    index = make_index()
+    assert index.validate('p1', 7, 'RUB', 100000) == (True, None)
+    assert index.get('p1').status == 'pre_checkout'
+
+
+def test_validate_rejects_unknown_invoice():
+    ok, error = make_index().validate('missing', 7, 'RUB', 100000)
+    assert not ok and 'устарел' in error
+
+
+def test_validate_rejects_expired_invoice():
+    index = InvoiceIndex(dict(TARIFFS), ttl=60)
+    index.add(OpenInvoice('old', user_id=7, tariff='Тариф 1', amount=100000, created_at=time.time() - 61))
+    ok, error = index.validate('old', 7, 'RUB', 100000)
+    assert not ok and 'устарел' in error
+
+
+def test_validate_rejects_other_user():
+    ok, error = make_index().validate('p1', 8, 'RUB', 100000)
+    assert not ok and 'другому пользователю' in error
+
+
+def test_validate_rejects_changed_amount_or_currency():
+    index = make_index()
+    assert not index.validate('p1', 7, 'RUB', 200000)[0]
+    assert not index.validate('p1', 7, 'USD', 100000)[0]
+
+
+def test_validate_rejects_when_tariff_price_changed():
+    index = make_index()
+    index.tariffs['Тариф 1'] = 1500
+    ok, error = index.validate('p1', 7, 'RUB', 100000)
+    assert not ok and 'Сумма счета изменилась' in error
+
+
+def test_validate_rejects_removed_tariff():
+    index = make_index()
+    del index.tariffs['Тариф 1']
+    ok, error = index.validate('p1', 7, 'RUB', 100000)
+    assert not ok and 'Тариф больше недоступен' in error
+
+
+def test_add_evicts_expired_invoices():
+    index = InvoiceIndex(dict(TARIFFS), ttl=60)
+    index.add(OpenInvoice('old', user_id=7, tariff='Тариф 1', amount=100000, created_at=time.time() - 61))
+    index.add(OpenInvoice('new', user_id=7, tariff='Тариф 1', amount=100000))
+    assert index.get('old') is None
+    assert len(index) == 1
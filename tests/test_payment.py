@@ -0,0 +1,117 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import handler.payment
+from config.http import close_session
+from config.registry import BotConfig, load_bot_configs, tariff_from_text
+from handler.payment import PaymentProcessor, YooKassaError
+
+
+async def with_api(monkeypatch, scenario):
+    """
+    Запускает локальный сервер вместо API ЮKassa и выполняет scenario(requests).
+    """
+    requests = []
+
+    async def handle(request):
+        login, _, password = base64.b64decode(request.headers['Authorization'].split()[1]).decode().partition(':')
+        body = await request.json() if request.can_read_body else None
+        requests.append({'method': request.method, 'path': request.path, 'query': dict(request.query),
+                         'auth': (login, password), 'key': request.headers.get('Idempotence-Key'), 'body': body})
+        if request.path == '/payments/missing':
+            return web.json_response({'type': 'error', 'code': 'not_found', 'description': 'Payment not found'},
+                                     status=404)
+        if request.path == '/payments' and request.method == 'POST':
+            return web.json_response({'id': 'pay-1', 'confirmation': {'confirmation_url': 'https://pay/1'}})
+        return web.json_response({'id': request.path.split('/')[-1], 'status': 'succeeded', 'items': []})
+
+    app = web.Application()
+    app.router.add_route('*', '/{path:.*}', handle)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setattr(handler.payment, 'API_URL', str(server.make_url('')).rstrip('/'))
+    try:
+        await scenario(requests)
+    finally:
+        await close_session()
+        await server.close()
+
+
+def test_each_shop_uses_its_own_credentials(monkeypatch):
+    async def scenario(requests):
+        shop1 = PaymentProcessor('shop-1', 'secret-1')
+        shop2 = PaymentProcessor('shop-2', 'secret-2')
+        await asyncio.gather(shop1.get_payment('p1'), shop2.get_payment('p2'))
+        assert {request['path']: request['auth'] for request in requests} == \
+            {'/payments/p1': ('shop-1', 'secret-1'), '/payments/p2': ('shop-2', 'secret-2')}
+
+    asyncio.run(with_api(monkeypatch, scenario))
+
+
+def test_create_payment_returns_url_and_id(monkeypatch):
+    async def scenario(requests):
+        url, payment_id = await PaymentProcessor('shop', 'secret').create_payment('100.00', 'RUB', 'Тариф 1')
+        assert (url, payment_id) == ('https://pay/1', 'pay-1')
+        assert requests[0]['key'] and requests[0]['body']['amount'] == {'value': '100.00', 'currency': 'RUB'}
+
+    asyncio.run(with_api(monkeypatch, scenario))
+
+
+def test_post_requests_send_the_given_idempotence_key(monkeypatch):
+    async def scenario(requests):
+        processor = PaymentProcessor('shop', 'secret')
+        await processor.create_refund('p1', '10.00', 'RUB', idempotence_key='key-1')
+        await processor.cancel_payment('p1', idempotence_key='key-2')
+        await processor.list_payments({'status': 'succeeded', 'limit': 100})
+        assert [request['key'] for request in requests] == ['key-1', 'key-2', None]
+        assert requests[2]['query'] == {'status': 'succeeded', 'limit': '100'}
+
+    asyncio.run(with_api(monkeypatch, scenario))
+
+
+def test_api_errors_raise_yookassa_error(monkeypatch):
+    async def scenario(requests):
+        processor = PaymentProcessor('shop', 'secret')
+        with pytest.raises(YooKassaError) as error:
+            await processor.get_payment('missing')
+        assert (error.value.status, error.value.code, error.value.is_final) == (404, 'not_found', True)
+        assert await processor.get_payment_info('missing') == {}
+
+    asyncio.run(with_api(monkeypatch, scenario))
+
+
+def test_yookassa_error_is_final_only_for_client_errors():
+    assert YooKassaError(400).is_final
+    assert not YooKassaError(429).is_final
+    assert not YooKassaError(500).is_final
+
+
+def test_load_bot_configs_from_registry(tmp_path):
+    path = tmp_path / 'bots.json'
+    path.write_text(json.dumps([
+        {'bot_id': 'brand1', 'token': 't1', 'account_id': 'shop-1', 'secret_key': 's1', 'tariffs': {'Premium': 500}},
+        {'bot_id': 'brand2', 'token': 't2'},
+    ]), encoding='utf-8')
+    configs = load_bot_configs(str(path))
+    assert list(configs) == ['brand1', 'brand2']
+    assert configs['brand1'].tariffs == {'Premium': 500}
+    assert configs['brand1'].api_url('sendMessage') == 'https://api.telegram.org/bott1/sendMessage'
+    assert configs['brand2'].tariffs == BotConfig('x').tariffs
+
+
+def test_load_bot_configs_rejects_duplicate_bot_id(tmp_path):
+    path = tmp_path / 'bots.json'
+    path.write_text(json.dumps([{'bot_id': 'brand1'}, {'bot_id': 'brand1'}]), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_bot_configs(str(path))
+
+
+def test_tariff_from_text():
+    assert tariff_from_text('Premium: 500 RUB') == 'Premium'
+    assert tariff_from_text('Тариф 1') == 'Тариф 1'
+    assert tariff_from_text('Мой профиль') == 'Мой профиль'
@@ -0,0 +1,33 @@
+import asyncio
+
+from aiohttp.test_utils import make_mocked_request
+
+from bot.hrbot import HrBot
+
+
+def profile_request(query: str, token: str = 'admin-token'):
+    return make_mocked_request('GET', f'/admin/profile?{query}', headers={'X-Admin-Token': token})
+
+
+def test_is_admin_requires_matching_token(monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'admin-token')
+    assert HrBot.is_admin(profile_request(''))
+    assert not HrBot.is_admin(profile_request('', token='wrong'))
+    assert not HrBot.is_admin(make_mocked_request('GET', '/admin/profile'))
+    monkeypatch.delenv('ADMIN_TOKEN')
+    assert not HrBot.is_admin(profile_request(''))
+
+
+def test_profile_rejects_invalid_seconds(monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'admin-token')
+    for seconds in ('nan', 'inf', '-1', '0', 'abc'):
+        response = asyncio.run(HrBot.handle_profile(profile_request(f'seconds={seconds}')))
+        assert response.status == 400, seconds
+
+
+def test_profile_collects_samples(monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'admin-token')
+    response = asyncio.run(HrBot.handle_profile(profile_request('seconds=0.05')))
+    assert response.status == 200
+    # Профилировщик освобожден, следующий запрос не получает 409
+    assert asyncio.run(HrBot.handle_profile(profile_request('seconds=0.05'))).status == 200
@@ -0,0 +1,90 @@
+import asyncio
+
+from coordination import SQLiteCoordinator
+from db import Database
+from handler.reconciliation import Reconciler, LEGACY_CHECKPOINT_NAME
+
+
+class FakePaymentProcessor:
+    """
+    Отдает заранее заданные страницы списка платежей и запоминает параметры запросов.
+    """
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.requests = []
+
+    async def list_payments(self, params):
+        self.requests.append(dict(params))
+        items = self.pages.pop(0)
+        return {'items': items, 'next_cursor': f'cursor-{len(self.requests)}' if self.pages else None}
+
+
+def payment(payment_id: str, status: str, created_at: str) -> dict:
+    return {'id': payment_id, 'status': status, 'created_at': created_at}
+
+
+def make_coordinator() -> SQLiteCoordinator:
+    return SQLiteCoordinator(Database(':memory:'), node_id='test')
+
+
+def test_run_fixes_statuses_and_reports_unknown_payments():
+    coordinator = make_coordinator()
+    asyncio.run(coordinator.insert_order(1, 'Тариф 1', 'pending', 'pay-1'))
+    asyncio.run(coordinator.insert_order(2, 'Тариф 1', 'succeeded', 'pay-2'))
+    processor = FakePaymentProcessor([[payment('pay-1', 'succeeded', '2024-01-01T00:00:00'),
+                                       payment('pay-2', 'succeeded', '2024-01-02T00:00:00'),
+                                       payment('pay-3', 'succeeded', '2024-01-03T00:00:00')]])
+    report = asyncio.run(Reconciler(coordinator, processor).run())
+    assert report['fixed'] == [{'payment_id': 'pay-1', 'from': 'pending', 'to': 'succeeded'}]
+    assert report['unknown_payments'] == ['pay-3']
+    assert asyncio.run(coordinator.get_order_statuses(['pay-1'])) == {'pay-1': 'succeeded'}
+
+
+def test_run_follows_cursor_and_keeps_filters():
+    coordinator = make_coordinator()
+    asyncio.run(coordinator.set('reconciliation.default.created_at', '2024-01-01T00:00:00'))
+    processor = FakePaymentProcessor([[payment('a', 'succeeded', '2024-01-02T00:00:00')],
+                                      [payment('b', 'succeeded', '2024-01-03T00:00:00')]])
+    report = asyncio.run(Reconciler(coordinator, processor, page_size=1).run())
+    assert report['checked'] == 2
+    assert processor.requests[0] == {'limit': 1, 'created_at.gte': '2024-01-01T00:00:00'}
+    assert processor.requests[1] == {'limit': 1, 'created_at.gte': '2024-01-01T00:00:00', 'cursor': 'cursor-1'}
+
+
+def test_checkpoint_stops_at_earliest_open_payment():
+    coordinator = make_coordinator()
+    processor = FakePaymentProcessor([[payment('a', 'succeeded', '2024-01-01T00:00:00'),
+                                       payment('b', 'pending', '2024-01-02T00:00:00'),
+                                       payment('c', 'waiting_for_capture', '2024-01-03T00:00:00'),
+                                       payment('d', 'canceled', '2024-01-04T00:00:00')]])
+    report = asyncio.run(Reconciler(coordinator, processor).run())
+    assert report['checkpoint'] == '2024-01-02T00:00:00'
+    assert asyncio.run(coordinator.get('reconciliation.default.created_at')) == '2024-01-02T00:00:00'
+
+
+def test_checkpoint_moves_to_latest_payment_when_all_final():
+    coordinator = make_coordinator()
+    processor = FakePaymentProcessor([[payment('a', 'succeeded', '2024-01-01T00:00:00'),
+                                       payment('b', 'canceled', '2024-01-05T00:00:00')]])
+    report = asyncio.run(Reconciler(coordinator, processor).run())
+    assert report['checkpoint'] == '2024-01-05T00:00:00'
+
+
+def test_checkpoint_is_kept_when_nothing_new():
+    coordinator = make_coordinator()
+    asyncio.run(coordinator.set('reconciliation.default.created_at', '2024-01-01T00:00:00'))
+    report = asyncio.run(Reconciler(coordinator, FakePaymentProcessor([[]])).run())
+    assert report['checkpoint'] == '2024-01-01T00:00:00'
+
+
+def test_default_bot_falls_back_to_legacy_checkpoint():
+    coordinator = make_coordinator()
+    asyncio.run(coordinator.set(LEGACY_CHECKPOINT_NAME, '2024-01-01T00:00:00'))
+    processor = FakePaymentProcessor([[]])
+    asyncio.run(Reconciler(coordinator, processor).run())
+    assert processor.requests[0]['created_at.gte'] == '2024-01-01T00:00:00'
+
+    other = FakePaymentProcessor([[]])
+    asyncio.run(Reconciler(coordinator, other, bot_id='brand1').run())
+    assert 'created_at.gte' not in other.requests[0]
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+from bot.recorder import UpdateRecorder, read_segments
+
+
+def update(update_id: int) -> dict:
+    return {'update_id': update_id, 'message': {'text': 'Привет'}}
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path))
+    recorder.start()
+    for i in range(5):
+        recorder.record(update(i))
+    recorder.close()
+    assert [record['update'] for record in read_segments([str(tmp_path)])] == [update(i) for i in range(5)]
+
+
+def test_segment_is_rotated_by_size_in_bytes(tmp_path):
+    line_bytes = len('{"ts": 0.0, "update": {"update_id": 0, "message": {"text": "Привет"}}}\n'.encode('utf-8'))
+    recorder = UpdateRecorder(str(tmp_path), segment_bytes=line_bytes * 2)
+    recorder.start()
+    for i in range(4):
+        recorder.record(update(i))
+    recorder.close()
+    assert len(os.listdir(tmp_path)) == 2
+    assert len(list(read_segments([str(tmp_path)]))) == 4
+
+
+def test_write_error_skips_record_and_keeps_writing(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path))
+    open_segment = recorder._open_segment
+    calls = []
+
+    def failing_open_segment():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError(28, 'No space left on device')
+        return open_segment()
+
+    recorder._open_segment = failing_open_segment
+    recorder.start()
+    recorder.record(update(0))
+    recorder.record(update(1))
+    recorder.close()
+    assert recorder.dropped == 1
+    assert [record['update'] for record in read_segments([str(tmp_path)])] == [update(1)]
+
+
+def test_close_does_not_block_when_writer_is_gone(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path), max_queue=3)
+    recorder._thread = threading.Thread(target=lambda: None)
+    recorder._thread.start()
+    recorder._thread.join()
+    for i in range(5):
+        recorder.record(update(i))
+    started = time.monotonic()
+    recorder.close(timeout=0.5)
+    assert time.monotonic() - started < 1